@@ -1,18 +1,18 @@
 import os
-import json
 import logging
 from telegram import InputFile, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 import asyncio
+import time
 from telegram.ext import ConversationHandler, CallbackQueryHandler
 from datetime import datetime
 
 # Import our services and core logic
 from services.data_fetcher import data_fetcher_instance
 from core.risk_engine import risk_engine_instance
-from database import db_manager
-from utils.pdf_generator import create_report_pdf
+from database import db_manager, PositionConfig
+from utils.pdf_generator import create_report_pdf_async
 import pandas as pd
 from reporting import reporting_manager
 
@@ -25,6 +25,11 @@ ADJUST_DELTA, ADJUST_VAR = range(10, 12)
 SELECT_PUT_STRIKE, SELECT_CALL_STRIKE = range(20, 22)
 SELECT_BUY_PUT, SELECT_SELL_PUT, SELECT_SELL_CALL, SELECT_BUY_CALL, CONFIRM_CONDOR = range(30, 35)
 
+# --- Per-user state housekeeping ---
+# user_data keys that are long-lived preferences rather than conversation scratch state
+PERSISTENT_USER_DATA_KEYS = ('use_ml_vol',)
+STALE_USER_DATA_SECONDS = 60 * 60
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sends an updated welcome message with all commands."""
     user = update.effective_user
@@ -51,13 +56,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 
 async def stop_monitoring_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    db_manager.delete_position(chat_id)
-    db_manager.clear_holdings(chat_id) # Also clear the holdings state
+    await db_manager.adelete_position(chat_id)
+    await db_manager.aclear_holdings(chat_id) # Also clear the holdings state
     await update.message.reply_text("✅ All monitoring and portfolio state has been stopped and cleared.")
 
 async def auto_hedge_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await update.message.reply_text("❌ Please set up a position with `/monitor_risk` first.")
         return
@@ -65,8 +70,8 @@ async def auto_hedge_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         status = context.args[0].lower()
         if status not in ['on', 'off']: raise ValueError()
         
-        position['auto_hedge_enabled'] = 1 if status == 'on' else 0
-        db_manager.upsert_position(chat_id, position)
+        config = PositionConfig.from_row(position, auto_hedge_enabled=1 if status == 'on' else 0)
+        await db_manager.aupsert_position(config)
         
         mode = "ENABLED" if status == 'on' else "DISABLED"
         await update.message.reply_text(f"✅ **Automated hedging is now {mode}.**")
@@ -74,7 +79,7 @@ async def auto_hedge_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("❌ Usage: `/auto_hedge <on|off>`")
 
 async def hedge_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    position = db_manager.get_position(update.effective_chat.id)
+    position = await db_manager.aget_position(update.effective_chat.id)
     if not position:
         await update.message.reply_text("ℹ️ You are not currently monitoring any position.")
         return
@@ -89,26 +94,29 @@ async def hedge_status_command(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.reply_text(status_text, parse_mode=ParseMode.MARKDOWN)
 
 async def hedge_history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    history = db_manager.get_hedge_history(update.effective_chat.id)
+    history = await db_manager.aget_hedge_history(update.effective_chat.id)
     if not history:
         await update.message.reply_text("ℹ️ No hedge history found.")
         return
     
     report = "**📜 Recent Hedge History**\n\n"
     for item in history:
-        details = json.loads(item['details'])
         ts = datetime.strptime(item['timestamp'], '%Y-%m-%d %H:%M:%S').strftime('%d-%b %H:%M')
-        cost = details.get('total_cost_usd', 0)
+        cost = item['total_cost_usd'] or 0
         report += (
             f"**{ts}** - `{item['action'].upper()}`\n"
             f"  - Size: `{abs(item['size']):.4f}`\n"
             f"  - Cost: `${cost:,.2f}`\n"
-            f"  - Venue: `{details.get('venue', 'N/A').upper()}`\n---\n"
+            f"  - Venue: `{(item['venue'] or 'N/A').upper()}`\n---\n"
         )
     await update.message.reply_text(report, parse_mode=ParseMode.MARKDOWN)
 
-async def execute_hedge_logic(context: ContextTypes.DEFAULT_TYPE, chat_id: int, size: float, asset: str):
-    """A reusable function to perform and log a simulated hedge."""
+async def execute_hedge_logic(context: ContextTypes.DEFAULT_TYPE, chat_id: int, size: float, asset: str, pending_writes: tuple | None = None):
+    """
+    A reusable function to perform and log a simulated hedge. If pending_writes
+    (a (hedge_rows, holding_rows) pair) is given, the rows are appended to it for
+    the caller to flush instead of being written immediately.
+    """
     perp_symbol = f"{asset}/USDT:USDT"
     execution_plan = await risk_engine_instance.find_best_execution_venue(perp_symbol, size)
     
@@ -116,20 +124,14 @@ async def execute_hedge_logic(context: ContextTypes.DEFAULT_TYPE, chat_id: int,
         await context.bot.send_message(chat_id, "❌ Hedge failed: Could not determine an execution plan.")
         return None
 
-    # Log the successful simulated hedge to the database
-    db_manager.log_hedge(
-        chat_id=chat_id,
-        hedge_type='perp',
-        action='short' if size < 0 else 'long',
-        size=size,
-        details=json.dumps(execution_plan)
-    )
-    db_manager.upsert_holding(
-        chat_id=chat_id,
-        symbol=perp_symbol, # Using Bybit's symbol format as the key
-        asset_type='perp',
-        quantity_change=size
-    )
+    # Log the successful simulated hedge and its holding change in a single commit
+    hedge_rows = [(chat_id, 'perp', 'short' if size < 0 else 'long', size, execution_plan)]
+    holding_rows = [(chat_id, perp_symbol, 'perp', size)] # Using Bybit's symbol format as the key
+    if pending_writes is not None:
+        pending_writes[0].extend(hedge_rows)
+        pending_writes[1].extend(holding_rows)
+    else:
+        await db_manager.arecord_hedges(hedge_rows, holding_rows)
     return execution_plan
 
 async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -152,7 +154,7 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def hedge_options_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the options hedging conversation."""
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await update.message.reply_text("❌ Please set up a position to monitor first using `/monitor_risk`.")
         return ConversationHandler.END
@@ -334,7 +336,7 @@ async def select_strike(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     await query.answer()
 
     chat_id = query.message.chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await query.edit_message_text("❌ Error: Could not find your monitored position. Please /start over.")
         return ConversationHandler.END
@@ -505,18 +507,19 @@ async def portfolio_risk_command(update: Update, context: ContextTypes.DEFAULT_T
 
     try:
         # --- 1. Fetch ALL holdings from the database ---
-        holdings = db_manager.get_holdings(chat_id)
+        holdings = await db_manager.aget_holdings(chat_id)
         if not holdings:
             await msg.edit_text("❌ You have no holdings to analyze. Use `/monitor_risk` to start.")
             return
 
         # --- 2. Gather live data for all assets concurrently ---
-        btc_spot_price = await data_fetcher_instance.get_price('bybit', 'BTC/USDT')
+        prices = await data_fetcher_instance.get_prices('bybit', ['BTC/USDT', 'BTC/USDT:USDT'])
+        btc_spot_price = prices.get('BTC/USDT')
         if not btc_spot_price:
             await msg.edit_text("❌ Critical error: Could not fetch the live price of BTC. Cannot generate report.")
             return
             
-        prices = {'BTC/USDT': btc_spot_price, 'BTC/USDT:USDT': btc_spot_price} # Assume perp price tracks spot closely for this report
+        prices.setdefault('BTC/USDT:USDT', btc_spot_price) # Perp tracks spot closely if its own price is unavailable
 
         portfolio_for_risk_calc = []
         portfolio_details = []
@@ -632,93 +635,108 @@ async def risk_check_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     It loops through all user configurations and their corresponding portfolio holdings
     to make intelligent, incremental hedging decisions.
     """
-    all_configs = db_manager.get_all_positions()
+    all_configs = await db_manager.aget_positions_for_monitoring()
     if not all_configs:
         return  # No work to do if no users are monitoring.
 
-    # Fetch primary asset prices once to be efficient
-    btc_spot_price = await data_fetcher_instance.get_price('bybit', 'BTC/USDT')
-    btc_perp_price = await data_fetcher_instance.get_price('bybit', 'BTC/USDT:USDT')
+    # Fetch primary asset prices once to be efficient (both are streamed from startup)
+    primary_prices = await data_fetcher_instance.get_prices('bybit', ['BTC/USDT', 'BTC/USDT:USDT'])
+    btc_spot_price = primary_prices.get('BTC/USDT')
+    btc_perp_price = primary_prices.get('BTC/USDT:USDT')
 
     if not btc_spot_price or not btc_perp_price:
         log.error("Could not fetch primary BTC prices. Skipping this risk check cycle.")
         return
 
-    for config in all_configs:
-        chat_id = config['chat_id']
+    # Hedge writes from every user are collected and flushed in a single commit
+    # once the sweep is done, instead of one commit per user.
+    pending_writes = ([], [])
+    try:
+        for config in all_configs:
+            chat_id = config.chat_id
         
-        # --- 1. Get current state of the entire portfolio from the database ---
-        holdings = db_manager.get_holdings(chat_id)
-        if not holdings:
-            log.warning(f"No holdings found for configured user {chat_id}. Skipping.")
-            continue
+            # --- 1. Get current state of the entire portfolio from the database ---
+            holdings = await db_manager.aget_holdings(chat_id)
+            if not holdings:
+                log.warning(f"No holdings found for configured user {chat_id}. Skipping.")
+                continue
 
-        # --- 2. Calculate NET portfolio delta ---
-        net_portfolio_delta_usd = 0.0
-        try:
-            for holding in holdings:
-                if holding['asset_type'] == 'spot':
-                    net_portfolio_delta_usd += holding['quantity'] * btc_spot_price
+            # --- 2. Calculate NET portfolio delta ---
+            net_portfolio_delta_usd = 0.0
+            try:
+                for holding in holdings:
+                    if holding['asset_type'] == 'spot':
+                        net_portfolio_delta_usd += holding['quantity'] * btc_spot_price
                 
-                elif holding['asset_type'] == 'perp':
-                    net_portfolio_delta_usd += holding['quantity'] * btc_perp_price
+                    elif holding['asset_type'] == 'perp':
+                        net_portfolio_delta_usd += holding['quantity'] * btc_perp_price
                 
-                elif holding['asset_type'] == 'option':
-                    option_ticker = await data_fetcher_instance.fetch_option_ticker(holding['symbol'])
-                    if option_ticker:
-                        greeks = await risk_engine_instance.calculate_option_greeks(btc_spot_price, option_ticker, use_ml_vol=False)
-                        if greeks:
-                            net_portfolio_delta_usd += holding['quantity'] * greeks['delta'] * btc_spot_price
-        except Exception as e:
-            log.error(f"Error calculating net delta for user {chat_id}: {e}")
-            continue # Skip to the next user
-
-        log.info(f"User {chat_id}: Calculated Net Portfolio Delta = ${net_portfolio_delta_usd:,.2f}")
-
-        # --- 3. Check if the NET delta exceeds the user's threshold ---
-        if abs(net_portfolio_delta_usd) > config['delta_threshold']:
-            log.info(f"NET DELTA THRESHOLD BREACHED for {chat_id}. Required hedge.")
+                    elif holding['asset_type'] == 'option':
+                        option_ticker = await data_fetcher_instance.fetch_option_ticker(holding['symbol'])
+                        if option_ticker:
+                            greeks = await risk_engine_instance.calculate_option_greeks(btc_spot_price, option_ticker, use_ml_vol=False)
+                            if greeks:
+                                net_portfolio_delta_usd += holding['quantity'] * greeks['delta'] * btc_spot_price
+            except Exception as e:
+                log.error(f"Error calculating net delta for user {chat_id}: {e}")
+                continue # Skip to the next user
+
+            log.info(f"User {chat_id}: Calculated Net Portfolio Delta = ${net_portfolio_delta_usd:,.2f}")
+
+            # --- 3. Check if the NET delta exceeds the user's threshold ---
+            if abs(net_portfolio_delta_usd) > config.delta_threshold:
+                log.info(f"NET DELTA THRESHOLD BREACHED for {chat_id}. Required hedge.")
             
-            # --- 4. Calculate the required hedge for the REMAINING delta ---
-            beta = 1.0  # Assuming 1:1 hedge ratio for BTC spot/perp
-            hedge_details = risk_engine_instance.calculate_perp_hedge(
-                spot_position_usd=net_portfolio_delta_usd,
-                perp_price=btc_perp_price,
-                beta=beta
-            )
-            hedge_contracts_to_trade = hedge_details['required_hedge_contracts']
-
-            # --- 5. Execute or Alert based on user's auto_hedge setting ---
-            if config['auto_hedge_enabled']:
-                # The auto-hedge logic with large trade confirmation safety check
-                hedge_value_usd = abs(hedge_contracts_to_trade * btc_perp_price)
-                large_trade_limit = config.get('large_trade_threshold')
+                # --- 4. Calculate the required hedge for the REMAINING delta ---
+                beta = 1.0  # Assuming 1:1 hedge ratio for BTC spot/perp
+                hedge_details = risk_engine_instance.calculate_perp_hedge(
+                    spot_position_usd=net_portfolio_delta_usd,
+                    perp_price=btc_perp_price,
+                    beta=beta
+                )
+                hedge_contracts_to_trade = hedge_details['required_hedge_contracts']
+
+                # --- 5. Execute or Alert based on user's auto_hedge setting ---
+                if config.auto_hedge_enabled:
+                    # The auto-hedge logic with large trade confirmation safety check
+                    hedge_value_usd = abs(hedge_contracts_to_trade * btc_perp_price)
+                    large_trade_limit = config.large_trade_threshold
                 
-                if large_trade_limit and hedge_value_usd > large_trade_limit:
-                    log.warning(f"LARGE TRADE DETECTED for {chat_id}. Reverting to manual confirmation.")
-                    await context.bot.send_message(chat_id, f"⚠️ **Large Trade - Manual Confirmation Required!**\n\nThe required hedge of `${hedge_value_usd:,.2f}` exceeds your safety limit of `${large_trade_limit:,.2f}`.")
-                    # Fall through to send the manual confirmation alert below
-                else:
-                    await context.bot.send_message(chat_id, "🚨 **Auto-Hedge Triggered!** Executing trade...")
-                    await execute_hedge_logic(context, chat_id, hedge_contracts_to_trade, config['asset'])
-                    continue # Move to the next user
+                    if large_trade_limit and hedge_value_usd > large_trade_limit:
+                        log.warning(f"LARGE TRADE DETECTED for {chat_id}. Reverting to manual confirmation.")
+                        await context.bot.send_message(chat_id, f"⚠️ **Large Trade - Manual Confirmation Required!**\n\nThe required hedge of `${hedge_value_usd:,.2f}` exceeds your safety limit of `${large_trade_limit:,.2f}`.")
+                        # Fall through to send the manual confirmation alert below
+                    else:
+                        await context.bot.send_message(chat_id, "🚨 **Auto-Hedge Triggered!** Executing trade...")
+                        await execute_hedge_logic(context, chat_id, hedge_contracts_to_trade, config.asset, pending_writes)
+                        continue # Move to the next user
             
-            # --- Send Manual Alert if auto_hedge is OFF or if a large trade was detected ---
-            message = (
-                f"🚨 **Delta Risk Alert: {config['asset']}** 🚨\n\n"
-                f"Your **net portfolio delta** of `${net_portfolio_delta_usd:,.2f}` has exceeded your threshold of `${config['delta_threshold']:,.2f}`.\n\n"
-                f"**Recommended Rebalancing Trade:**\nShort `{abs(hedge_contracts_to_trade):.4f}` of `{config['perp_symbol']}`."
-            )
-            keyboard = [
-                [InlineKeyboardButton("✅ Hedge Now (Simulated)", callback_data=f"hedge_now_{config['asset']}_{hedge_contracts_to_trade:.4f}")],
-                [
-                    InlineKeyboardButton("📊 View Analytics", callback_data="view_analytics"),
-                    InlineKeyboardButton("⚙️ Adjust Thresholds", callback_data="adjust_thresholds_prompt")
-                ],
-                [InlineKeyboardButton("Dismiss", callback_data="dismiss_alert")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await context.bot.send_message(chat_id, text=message, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+                # --- Send Manual Alert if auto_hedge is OFF or if a large trade was detected ---
+                message = (
+                    f"🚨 **Delta Risk Alert: {config.asset}** 🚨\n\n"
+                    f"Your **net portfolio delta** of `${net_portfolio_delta_usd:,.2f}` has exceeded your threshold of `${config.delta_threshold:,.2f}`.\n\n"
+                    f"**Recommended Rebalancing Trade:**\nShort `{abs(hedge_contracts_to_trade):.4f}` of `{config.perp_symbol}`."
+                )
+                keyboard = [
+                    [InlineKeyboardButton("✅ Hedge Now (Simulated)", callback_data=f"hedge_now_{config.asset}_{hedge_contracts_to_trade:.4f}")],
+                    [
+                        InlineKeyboardButton("📊 View Analytics", callback_data="view_analytics"),
+                        InlineKeyboardButton("⚙️ Adjust Thresholds", callback_data="adjust_thresholds_prompt")
+                    ],
+                    [InlineKeyboardButton("Dismiss", callback_data="dismiss_alert")]
+                ]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await context.bot.send_message(chat_id, text=message, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+    finally:
+        # Flushed even if the sweep stops early (e.g. a user blocked the bot), so hedges
+        # already announced are recorded and not repeated on the next tick
+        if pending_writes[0]:
+            try:
+                await db_manager.arecord_hedges(*pending_writes)
+            except Exception as e:
+                # Logged rather than raised, so it can't mask the error that ended the sweep
+                log.error(f"Failed to record {len(pending_writes[0])} hedges from the risk check: {e}")
 
 # --- UPDATE BUTTON HANDLER ---
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -776,7 +794,7 @@ async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_
 # --- Reusable Reporting Functions ---
 async def send_portfolio_report(chat_id: int, context: ContextTypes.DEFAULT_TYPE):
     """Refactored logic to send the main portfolio risk report."""
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await context.bot.send_message(chat_id, "❌ No position found. Use `/monitor_risk` to set one up.")
         return
@@ -820,27 +838,27 @@ async def monitor_risk_command(update: Update, context: ContextTypes.DEFAULT_TYP
         var_threshold = float(args[3]) if len(args) > 3 else None
         
         # --- 1. First, clear any pre-existing portfolio state for this user ---
-        db_manager.clear_holdings(chat_id)
+        await db_manager.aclear_holdings(chat_id)
         log.info(f"Cleared existing holdings for chat_id: {chat_id} before starting new monitoring.")
 
         # --- 2. Set up the new monitoring configuration in the 'positions' table ---
-        position_data = {
-            "chat_id": chat_id,
-            "asset": asset,
-            "spot_symbol": f"{asset}/USDT",
-            "perp_symbol": f"{asset}/USDT:USDT",
-            "size": size,
-            "delta_threshold": delta_threshold,
-            "var_threshold": var_threshold,
-        }
-        db_manager.upsert_position(chat_id, position_data)
+        position_config = PositionConfig(
+            chat_id=chat_id,
+            asset=asset,
+            spot_symbol=f"{asset}/USDT",
+            perp_symbol=f"{asset}/USDT:USDT",
+            size=size,
+            delta_threshold=delta_threshold,
+            var_threshold=var_threshold,
+        )
+        await db_manager.aupsert_position(position_config)
 
         # --- 3. Add the initial spot position to the new 'portfolio_holdings' state table ---
-        db_manager.upsert_holding(
+        await db_manager.aupsert_holding(
             chat_id=chat_id,
-            symbol=position_data['spot_symbol'],
+            symbol=position_config.spot_symbol,
             asset_type='spot',
-            quantity_change=position_data['size']
+            quantity_change=position_config.size
         )
         
         await update.message.reply_text(
@@ -862,7 +880,7 @@ async def monitor_risk_command(update: Update, context: ContextTypes.DEFAULT_TYP
 async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     await context.bot.send_message(chat_id, "Generating your hedge history chart...")
-    history = db_manager.get_hedge_history(chat_id)
+    history = await db_manager.aget_hedge_history(chat_id)
     chart_buffer = risk_engine_instance.generate_hedge_history_chart(history)
     
     if chart_buffer:
@@ -876,12 +894,11 @@ async def adjust_threshold_start(update: Update, context: ContextTypes.DEFAULT_T
 
 async def adjust_delta_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if text := update.message.text.lower():
         if text != '/skip':
             try:
-                position['delta_threshold'] = float(text)
-                db_manager.upsert_position(chat_id, position)
+                await db_manager.aupsert_position(PositionConfig.from_row(position, delta_threshold=float(text)))
                 await update.message.reply_text("✅ Delta threshold updated.")
             except ValueError:
                 await update.message.reply_text("Invalid number. Please try again or /cancel.")
@@ -892,18 +909,16 @@ async def adjust_delta_received(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def adjust_var_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if text := update.message.text.lower():
         if text == '/skip':
             pass
         elif text == '/remove':
-            position['var_threshold'] = None
-            db_manager.upsert_position(chat_id, position)
+            await db_manager.aupsert_position(PositionConfig.from_row(position, var_threshold=None))
             await update.message.reply_text("✅ VaR threshold removed.")
         else:
             try:
-                position['var_threshold'] = float(text)
-                db_manager.upsert_position(chat_id, position)
+                await db_manager.aupsert_position(PositionConfig.from_row(position, var_threshold=float(text)))
                 await update.message.reply_text("✅ VaR threshold updated.")
             except ValueError:
                 await update.message.reply_text("Invalid number. Please try again or /cancel.")
@@ -918,17 +933,45 @@ async def cancel_adjustment(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def send_daily_summary(context: ContextTypes.DEFAULT_TYPE):
     log.info("Running daily summary job...")
-    positions = db_manager.get_all_positions()
+    positions = await db_manager.aget_all_positions()
     for pos in positions:
-        if pos.get('daily_summary_enabled'):
+        if pos['daily_summary_enabled']:
             chat_id = pos['chat_id']
             await context.bot.send_message(chat_id, "☀️ **Good morning! Here is your daily risk summary:**")
             await send_portfolio_report(chat_id, context)
 
+async def track_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stamps each user's last interaction so their stale conversation state can be swept."""
+    if context.user_data is not None: # e.g. channel posts have no user
+        context.user_data['last_seen'] = time.monotonic()
+
+async def sweep_stale_user_data_job(context: ContextTypes.DEFAULT_TYPE):
+    """Drops abandoned conversation state (strikes, expiries, ...) from idle users' user_data."""
+    cutoff = time.monotonic() - STALE_USER_DATA_SECONDS
+    swept = 0
+    for user_id, data in list(context.application.user_data.items()):
+        if data.get('last_seen', 0) >= cutoff:
+            continue
+        preferences = {k: data[k] for k in PERSISTENT_USER_DATA_KEYS if k in data}
+        if not preferences:
+            context.application.drop_user_data(user_id)
+            swept += 1
+        elif data.keys() - preferences.keys():
+            data.clear()
+            data.update(preferences)
+            swept += 1
+    if swept:
+        log.info(f"Swept stale conversation state for {swept} idle users.")
+
+async def wal_checkpoint_job(context: ContextTypes.DEFAULT_TYPE):
+    """Keeps the SQLite WAL file small so reads don't have to walk a long log."""
+    await db_manager.acheckpoint()
+
 async def generate_report_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Generates and sends a formal PDF report."""
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    # Position and up to 50 recent trades, read in a single database round-trip
+    position, history_data = await db_manager.aget_position_and_history(chat_id, limit=50)
     if not position:
         await update.message.reply_text("❌ No position found to report on.")
         return
@@ -949,9 +992,6 @@ async def generate_report_command(update: Update, context: ContextTypes.DEFAULT_
         portfolio_for_risk = [{'type': 'spot', 'asset': position['asset'], 'size': position['size']}]
         risk_data = await risk_engine_instance.calculate_portfolio_risk(portfolio_for_risk, prices)
         var_data = await risk_engine_instance.calculate_historical_var(portfolio_for_risk, prices)
-        
-        # History Data
-        history_data = db_manager.get_hedge_history(chat_id, limit=50) # Get up to 50 recent trades
 
         report_data = {
             "positions": positions_for_report,
@@ -961,9 +1001,10 @@ async def generate_report_command(update: Update, context: ContextTypes.DEFAULT_
 
         # --- 2. Create and send PDF ---
         filename = f"report_{chat_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        create_report_pdf(filename, report_data)
+        pdf_bytes = await create_report_pdf_async(filename, report_data)
         
-        await context.bot.send_document(chat_id, document=open(filename, 'rb'),
+        # Sent from memory, so no file handle is left open on the written copy
+        await context.bot.send_document(chat_id, document=InputFile(pdf_bytes, filename=filename),
                                         caption="Here is your requested Portfolio Risk & Compliance Report.")
         await msg.delete() # Clean up the "please wait" message
 
@@ -978,7 +1019,7 @@ async def generate_report_command(update: Update, context: ContextTypes.DEFAULT_
 async def configure_strategy_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Configures the parameters for the intelligent hedging strategy."""
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await update.message.reply_text("❌ Please set up a position with `/monitor_risk` first.")
         return
@@ -996,15 +1037,16 @@ async def configure_strategy_command(update: Update, context: ContextTypes.DEFAU
             await update.message.reply_text("❌ Use 'on' or 'off' for the regime filter.")
             return
 
-        position['hedge_ratio'] = hedge_ratio
-        position['use_regime_filter'] = 1 if use_filter_str == 'on' else 0
+        config = PositionConfig.from_row(
+            position, hedge_ratio=hedge_ratio, use_regime_filter=1 if use_filter_str == 'on' else 0
+        )
         
-        db_manager.upsert_position(chat_id, position)
+        await db_manager.aupsert_position(config)
         
         await update.message.reply_text(
             "✅ **Strategy Updated**\n\n"
-            f"**Hedge Ratio:** `{position['hedge_ratio']}` (hedging {position['hedge_ratio']*100}% of exposure)\n"
-            f"**Regime Filter:** `{'ON' if position['use_regime_filter'] else 'OFF'}`\n\n"
+            f"**Hedge Ratio:** `{config.hedge_ratio}` (hedging {config.hedge_ratio*100}% of exposure)\n"
+            f"**Regime Filter:** `{'ON' if config.use_regime_filter else 'OFF'}`\n\n"
             "Your live bot will now use this logic.",
             parse_mode=ParseMode.MARKDOWN
         )
@@ -1013,7 +1055,7 @@ async def configure_strategy_command(update: Update, context: ContextTypes.DEFAU
 
 async def set_large_trade_limit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await update.message.reply_text("❌ Please set up a position with `/monitor_risk` first.")
         return
@@ -1027,8 +1069,7 @@ async def set_large_trade_limit_command(update: Update, context: ContextTypes.DE
             if limit <= 0: raise ValueError()
             message = f"✅ Large trade limit set to `${limit:,.2f}`."
         
-        position['large_trade_threshold'] = limit
-        db_manager.upsert_position(chat_id, position)
+        await db_manager.aupsert_position(PositionConfig.from_row(position, large_trade_threshold=limit))
         await update.message.reply_text(message)
     except (IndexError, ValueError):
         await update.message.reply_text("❌ Usage: `/set_large_trade_limit <USD_VALUE>` or `/set_large_trade_limit off`")
@@ -1096,17 +1137,19 @@ async def handle_export_callback(update: Update, context: ContextTypes.DEFAULT_T
     await query.edit_message_text("Generating your report...")
 
     chat_id = query.message.chat.id
+    if query.data not in ('export_settings', 'export_history'):
+        return
+    # Both exports read from the same single database round-trip
+    position, history = await db_manager.aget_position_and_history(chat_id)
     
     if query.data == 'export_settings':
-        csv_buffer = reporting_manager.generate_position_report_csv(chat_id)
+        csv_buffer = reporting_manager.generate_position_report_csv(position)
         filename = f"position_report_{chat_id}.csv"
         caption = "Your current risk configuration and settings."
-    elif query.data == 'export_history':
-        csv_buffer = reporting_manager.generate_trade_history_csv(chat_id)
+    else:
+        csv_buffer = reporting_manager.generate_trade_history_csv(history)
         filename = f"trade_history_{chat_id}.csv"
         caption = "A complete ledger of your simulated hedge trades."
-    else:
-        return
 
     if csv_buffer:
         # We need to create an InputFile object for Telegram
@@ -1281,7 +1324,7 @@ async def handle_stress_test_callback(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     chat_id = query.message.chat.id
-    position = db_manager.get_position(chat_id)
+    position = await db_manager.aget_position(chat_id)
     if not position:
         await query.edit_message_text("❌ No position found. Please set one up with /monitor_risk first.")
         return
@@ -1,214 +1,442 @@
 import sqlite3
 import logging
-from typing import List, Dict, Any
+import json
+import msgpack
+import atexit
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from operator import attrgetter
+from typing import List, Dict, Any, Iterable, Tuple
 
 log = logging.getLogger(__name__)
 DB_FILE = "hedging_bot.db"
+# Bump this (and extend create_tables) whenever the schema changes
+SCHEMA_VERSION = 3
+
+# positions is always looked up by its INTEGER PRIMARY KEY, so it is stored
+# clustered on chat_id (WITHOUT ROWID) rather than behind a hidden rowid.
+_DDL_POSITIONS = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        chat_id INTEGER PRIMARY KEY,
+        asset TEXT NOT NULL,
+        spot_symbol TEXT NOT NULL,
+        perp_symbol TEXT NOT NULL,
+        size REAL NOT NULL,
+        delta_threshold REAL NOT NULL,
+        var_threshold REAL,
+        auto_hedge_enabled INTEGER DEFAULT 0,
+        daily_summary_enabled INTEGER DEFAULT 1,
+        large_trade_threshold REAL,
+        slow_ma INTEGER DEFAULT 20,
+        fast_ma INTEGER DEFAULT 10,
+        use_regime_filter INTEGER DEFAULT 0,
+        hedge_ratio REAL DEFAULT 1.0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+"""
+
+# Hot-path SQL kept as stable module-level strings so every call hits the
+# connection's prepared-statement cache instead of being re-compiled.
+_SQL_UPSERT_POSITION = """
+    INSERT INTO positions (
+        chat_id, asset, spot_symbol, perp_symbol, size, 
+        delta_threshold, var_threshold, auto_hedge_enabled, 
+        daily_summary_enabled, large_trade_threshold,
+        slow_ma, fast_ma, use_regime_filter, hedge_ratio
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(chat_id) DO UPDATE SET
+        asset=excluded.asset,
+        spot_symbol=excluded.spot_symbol,
+        perp_symbol=excluded.perp_symbol,
+        size=excluded.size,
+        delta_threshold=excluded.delta_threshold,
+        var_threshold=excluded.var_threshold,
+        auto_hedge_enabled=excluded.auto_hedge_enabled,
+        daily_summary_enabled=excluded.daily_summary_enabled,
+        large_trade_threshold=excluded.large_trade_threshold,
+        slow_ma=excluded.slow_ma,
+        fast_ma=excluded.fast_ma,
+        use_regime_filter=excluded.use_regime_filter,
+        hedge_ratio=excluded.hedge_ratio
+"""
+_SQL_GET_POSITION = "SELECT * FROM positions WHERE chat_id = ?"
+_SQL_GET_ALL_POSITIONS = "SELECT * FROM positions"
+_SQL_GET_POSITIONS_FOR_MONITORING = """
+    SELECT chat_id, asset, perp_symbol, delta_threshold, auto_hedge_enabled, large_trade_threshold
+    FROM positions
+"""
+_SQL_DELETE_POSITION = "DELETE FROM positions WHERE chat_id = ?"
+_SQL_LOG_HEDGE = """
+    INSERT INTO hedge_history (chat_id, hedge_type, action, size, details, venue, total_cost_usd)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_GET_HEDGE_HISTORY = "SELECT * FROM hedge_history WHERE chat_id = ? ORDER BY timestamp DESC LIMIT ?"
+_SQL_UPSERT_HOLDING = """
+    INSERT INTO portfolio_holdings (chat_id, asset_symbol, asset_type, quantity)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(chat_id, asset_symbol) DO UPDATE SET
+        quantity = portfolio_holdings.quantity + excluded.quantity,
+        updated_at = CURRENT_TIMESTAMP
+"""
+_SQL_DELETE_ZERO_HOLDING = "DELETE FROM portfolio_holdings WHERE chat_id = ? AND asset_symbol = ? AND abs(quantity) < 1e-9"
+_SQL_GET_HOLDINGS = "SELECT * FROM portfolio_holdings WHERE chat_id = ?"
+_SQL_CLEAR_HOLDINGS = "DELETE FROM portfolio_holdings WHERE chat_id = ?"
+
+@dataclass(slots=True)
+class PositionConfig:
+    """A user's monitored position and risk settings, as stored in the positions table."""
+    chat_id: int
+    asset: str
+    spot_symbol: str
+    perp_symbol: str
+    size: float
+    delta_threshold: float
+    var_threshold: float | None = None
+    auto_hedge_enabled: int = 0
+    daily_summary_enabled: int = 1
+    large_trade_threshold: float | None = None
+    slow_ma: int = 20
+    fast_ma: int = 10
+    use_regime_filter: int = 0
+    hedge_ratio: float = 1.0  # Default to full hedge
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, **changes) -> "PositionConfig":
+        """Builds a config from a positions row, optionally overriding some fields."""
+        values = {name: row[name] for name in _POSITION_FIELDS}
+        values.update(changes)
+        return cls(**values)
+
+# Field order matches the column/placeholder order of _SQL_UPSERT_POSITION
+_POSITION_FIELDS = tuple(f.name for f in fields(PositionConfig))
+_position_params = attrgetter(*_POSITION_FIELDS)
+
+@dataclass(slots=True)
+class MonitoredPosition:
+    """The subset of a position's settings that the background risk check needs."""
+    chat_id: int
+    asset: str
+    perp_symbol: str
+    delta_threshold: float
+    auto_hedge_enabled: int
+    large_trade_threshold: float | None
+
+def pack_details(details: Dict[str, Any]) -> bytes:
+    """Serializes a hedge's details for the hedge_history.details column."""
+    return msgpack.packb(details, use_bin_type=True)
+
+def unpack_details(blob: bytes) -> Dict[str, Any]:
+    """Deserializes a hedge_history.details value back into a dict."""
+    return msgpack.unpackb(blob, raw=False)
+
+def _hedge_params(chat_id: int, hedge_type: str, action: str, size: float, details: Dict[str, Any]) -> tuple:
+    """Builds the _SQL_LOG_HEDGE parameters, copying the fields reports read into their own columns."""
+    return (chat_id, hedge_type, action, size, pack_details(details), details.get('venue'), details.get('total_cost_usd'))
 
 class DatabaseManager:
     def __init__(self, db_file: str):
         self.db_file = db_file
+        # One long-lived connection keeps SQLite's page cache and statement cache warm.
+        # isolation_level=None puts it in autocommit mode; the lock serializes access
+        # from the job queue and handler threads.
+        self._lock = threading.RLock()
+        self._conn = self._get_connection()
+        # The async API runs every call on this single worker so SQLite I/O never
+        # blocks the bot's event loop, while writes stay strictly serialized.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        atexit.register(self.close)
         self.create_tables()
 
     def _get_connection(self):
-        """Creates a database connection."""
-        return sqlite3.connect(self.db_file)
+        """Creates a database connection tuned for many small writes."""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # synchronous=NORMAL is safe under WAL and drops the fsync on every commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")  # 64 MiB page cache
+        conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def close(self):
+        """Closes the shared database connection."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+    async def _run(self, func, *args, **kwargs):
+        """Runs a blocking DatabaseManager method on the dedicated database thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups every write made inside the block into one transaction, so a batch
+        of writes costs a single commit. Nested use joins the outer transaction.
+        """
+        with self._lock:
+            if self._conn.in_transaction:
+                yield self._conn.cursor()
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn.cursor()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
 
     def create_tables(self):
-        log.info("Initializing database and creating tables if they don't exist...")
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS positions (
-            chat_id INTEGER PRIMARY KEY,
-            asset TEXT NOT NULL,
-            spot_symbol TEXT NOT NULL,
-            perp_symbol TEXT NOT NULL,
-            size REAL NOT NULL,
-            delta_threshold REAL NOT NULL,
-            var_threshold REAL,
-            auto_hedge_enabled INTEGER DEFAULT 0,
-            daily_summary_enabled INTEGER DEFAULT 1,
-            large_trade_threshold REAL,
-            slow_ma INTEGER DEFAULT 20,
-            fast_ma INTEGER DEFAULT 10,
-            use_regime_filter INTEGER DEFAULT 0,
-            hedge_ratio REAL DEFAULT 1.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-        # Table to store the history of all hedging actions
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS hedge_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                hedge_type TEXT NOT NULL, -- 'perp' or 'option'
-                action TEXT NOT NULL, -- 'short', 'buy_put', 'sell_call'
-                size REAL NOT NULL,
-                details TEXT, -- JSON string with price, cost, etc.
-                FOREIGN KEY (chat_id) REFERENCES positions (chat_id)
-            )
-        """)
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS portfolio_holdings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                asset_symbol TEXT NOT NULL, -- e.g., 'BTC/USDT', 'BTC-PERP', 'BTC-29NOV24-70000-P'
-                asset_type TEXT NOT NULL, -- 'spot', 'perp', 'option'
-                quantity REAL NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(chat_id, asset_symbol) -- A user can only have one entry per symbol
-            )
-        """)
-        conn.commit()
-        conn.close()
+        with self._lock:
+            # Fast path: a database already at the current schema needs no DDL at all
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+                log.info("Database schema is up to date.")
+                return
+
+            log.info("Initializing database and creating tables if they don't exist...")
+            # WAL mode is persistent in the database file, so it only needs to be set once
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            cursor = self._conn.cursor()
+            cursor.execute(_DDL_POSITIONS.format(table="positions"))
+            # Table to store the history of all hedging actions
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hedge_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    hedge_type TEXT NOT NULL, -- 'perp' or 'option'
+                    action TEXT NOT NULL, -- 'short', 'buy_put', 'sell_call'
+                    size REAL NOT NULL,
+                    details BLOB, -- MessagePack map with price, cost, etc.
+                    venue TEXT, -- copied out of details so reports can read it without unpacking
+                    total_cost_usd REAL, -- likewise
+                    FOREIGN KEY (chat_id) REFERENCES positions (chat_id)
+                )
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS portfolio_holdings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    asset_symbol TEXT NOT NULL, -- e.g., 'BTC/USDT', 'BTC-PERP', 'BTC-29NOV24-70000-P'
+                    asset_type TEXT NOT NULL, -- 'spot', 'perp', 'option'
+                    quantity REAL NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(chat_id, asset_symbol) -- A user can only have one entry per symbol
+                )
+            """)
+            # Lets get_hedge_history seek to a user's newest rows instead of scanning and sorting.
+            # portfolio_holdings needs no extra index: its UNIQUE(chat_id, asset_symbol)
+            # constraint already backs both the per-user and per-symbol lookups.
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_hedge_history_chat_ts
+                ON hedge_history (chat_id, timestamp DESC)
+            """)
+
+            # One-time migration: 'details' used to be stored as JSON text. SQLite keeps
+            # BLOB values as-is even in a column declared TEXT, so only legacy rows match.
+            with self.transaction() as cursor:
+                cursor.execute("SELECT id, details FROM hedge_history WHERE typeof(details) = 'text'")
+                legacy_rows = cursor.fetchall()
+                if legacy_rows:
+                    cursor.executemany(
+                        "UPDATE hedge_history SET details = ? WHERE id = ?",
+                        [(pack_details(json.loads(details)), row_id) for row_id, details in legacy_rows]
+                    )
+                    log.info(f"Migrated {len(legacy_rows)} hedge_history rows from JSON to MessagePack.")
+
+            # Schema v3: venue and total_cost_usd get native columns, backfilled from details
+            hedge_columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(hedge_history)")}
+            if 'venue' not in hedge_columns:
+                with self.transaction() as cursor:
+                    cursor.execute("ALTER TABLE hedge_history ADD COLUMN venue TEXT")
+                    cursor.execute("ALTER TABLE hedge_history ADD COLUMN total_cost_usd REAL")
+                    cursor.execute("SELECT id, details FROM hedge_history WHERE details IS NOT NULL")
+                    backfill = [
+                        (details.get('venue'), details.get('total_cost_usd'), row_id)
+                        for row_id, details in ((row_id, unpack_details(blob)) for row_id, blob in cursor.fetchall())
+                    ]
+                    cursor.executemany("UPDATE hedge_history SET venue = ?, total_cost_usd = ? WHERE id = ?", backfill)
+                log.info(f"Added venue/total_cost_usd columns to {len(backfill)} hedge_history rows.")
+
+            # Schema v2: positions moved to a WITHOUT ROWID table. SQLite cannot alter that
+            # in place, so older databases get the table rebuilt and their rows copied over.
+            positions_sql = self._conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'positions'"
+            ).fetchone()[0]
+            if "WITHOUT ROWID" not in positions_sql.upper():
+                with self.transaction() as cursor:
+                    cursor.execute("DROP TABLE IF EXISTS positions_new")
+                    cursor.execute(_DDL_POSITIONS.format(table="positions_new"))
+                    cursor.execute("INSERT INTO positions_new SELECT * FROM positions")
+                    cursor.execute("DROP TABLE positions")
+                    cursor.execute("ALTER TABLE positions_new RENAME TO positions")
+                log.info("Rebuilt positions table as WITHOUT ROWID.")
+
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         log.info("Database initialized successfully.")
 
-    def upsert_position(self, chat_id: int, data: Dict[str, Any]):
+    def upsert_position(self, config: PositionConfig):
         """Inserts a new position or updates it if the chat_id already exists."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-    
-        # Set defaults for optional fields
-        data.setdefault('var_threshold', None)
-        data.setdefault('auto_hedge_enabled', 0)
-        data.setdefault('daily_summary_enabled', 1)
-        data.setdefault('large_trade_threshold', None)
-        data.setdefault('slow_ma', 20)
-        data.setdefault('fast_ma', 10)
-        data.setdefault('use_regime_filter', 0)
-        data.setdefault('hedge_ratio', 1.0)  # Default to full hedge
-        
-        cursor.execute("""
-            INSERT INTO positions (
-                chat_id, asset, spot_symbol, perp_symbol, size, 
-                delta_threshold, var_threshold, auto_hedge_enabled, 
-                daily_summary_enabled, large_trade_threshold,
-                slow_ma, fast_ma, use_regime_filter, hedge_ratio
-            )
-            VALUES (
-                :chat_id, :asset, :spot_symbol, :perp_symbol, :size, 
-                :delta_threshold, :var_threshold, :auto_hedge_enabled, 
-                :daily_summary_enabled, :large_trade_threshold,
-                :slow_ma, :fast_ma, :use_regime_filter, :hedge_ratio
-            )
-            ON CONFLICT(chat_id) DO UPDATE SET
-                asset=excluded.asset,
-                spot_symbol=excluded.spot_symbol,
-                perp_symbol=excluded.perp_symbol,
-                size=excluded.size,
-                delta_threshold=excluded.delta_threshold,
-                var_threshold=excluded.var_threshold,
-                auto_hedge_enabled=excluded.auto_hedge_enabled,
-                daily_summary_enabled=excluded.daily_summary_enabled,
-                large_trade_threshold=excluded.large_trade_threshold,
-                slow_ma=excluded.slow_ma,
-                fast_ma=excluded.fast_ma,
-                use_regime_filter=excluded.use_regime_filter,
-                hedge_ratio=excluded.hedge_ratio
-        """, data)
-        conn.commit()
-        conn.close()
-        log.info(f"Upserted position for chat_id: {chat_id}")
-
-    def get_position(self, chat_id: int) -> Dict[str, Any] | None:
+        with self._lock:
+            self._conn.execute(_SQL_UPSERT_POSITION, _position_params(config))
+        log.debug("Upserted position for chat_id: %s", config.chat_id)
+
+    def get_position(self, chat_id: int) -> sqlite3.Row | None:
         """Retrieves a user's position by chat_id."""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM positions WHERE chat_id = ?", (chat_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(_SQL_GET_POSITION, (chat_id,))
+            return cursor.fetchone()
 
-    def get_all_positions(self) -> List[Dict[str, Any]]:
+    def get_all_positions(self) -> List[sqlite3.Row]:
         """Retrieves all monitored positions for the background job."""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM positions")
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(_SQL_GET_ALL_POSITIONS)
+            return cursor.fetchall()
+
+    def get_positions_for_monitoring(self) -> List[MonitoredPosition]:
+        """Retrieves only the columns the background risk check uses, for every position."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = lambda _, row: MonitoredPosition(*row)
+            cursor.execute(_SQL_GET_POSITIONS_FOR_MONITORING)
+            return cursor.fetchall()
 
     def delete_position(self, chat_id: int):
         """Deletes a user's monitored position."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM positions WHERE chat_id = ?", (chat_id,))
-        conn.commit()
-        conn.close()
-        log.info(f"Deleted position for chat_id: {chat_id}")
-
-    def log_hedge(self, chat_id: int, hedge_type: str, action: str, size: float, details: str):
+        with self._lock:
+            self._conn.execute(_SQL_DELETE_POSITION, (chat_id,))
+        log.debug("Deleted position for chat_id: %s", chat_id)
+
+    def log_hedge(self, chat_id: int, hedge_type: str, action: str, size: float, details: Dict[str, Any]):
         """Logs a completed hedge action to the history table."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO hedge_history (chat_id, hedge_type, action, size, details)
-            VALUES (?, ?, ?, ?, ?)
-        """, (chat_id, hedge_type, action, size, details))
-        conn.commit()
-        conn.close()
-        log.info(f"Logged hedge action for chat_id: {chat_id}")
-
-    def get_hedge_history(self, chat_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute(_SQL_LOG_HEDGE, _hedge_params(chat_id, hedge_type, action, size, details))
+        log.info("Logged hedge action for chat_id: %s", chat_id)
+
+    def log_hedges(self, rows: Iterable[Tuple[int, str, str, float, Dict[str, Any]]]):
+        """Logs several hedge actions, as (chat_id, hedge_type, action, size, details) rows, in one commit."""
+        rows = [_hedge_params(*row) for row in rows]
+        with self.transaction() as cursor:
+            cursor.executemany(_SQL_LOG_HEDGE, rows)
+        log.info("Logged %d hedge actions.", len(rows))
+
+    def record_hedges(self, hedge_rows: Iterable[Tuple[int, str, str, float, Dict[str, Any]]], holding_rows: Iterable[Tuple[int, str, str, float]]):
+        """Logs hedge actions together with the holding changes they cause, in one commit."""
+        with self.transaction():
+            self.log_hedges(hedge_rows)
+            self.upsert_holdings(holding_rows)
+
+    def get_hedge_history(self, chat_id: int, limit: int = 10) -> List[sqlite3.Row]:
         """Retrieves the most recent hedge history for a user."""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM hedge_history WHERE chat_id = ? ORDER BY timestamp DESC LIMIT ?", (chat_id, limit))
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(_SQL_GET_HEDGE_HISTORY, (chat_id, limit))
+            return cursor.fetchall()
     
+    def get_position_and_history(self, chat_id: int, limit: int = 10) -> Tuple[sqlite3.Row | None, List[sqlite3.Row]]:
+        """Retrieves a user's position and recent hedge history together, for reports that need both."""
+        with self._lock:
+            cursor = self._conn.cursor()
+            position = cursor.execute(_SQL_GET_POSITION, (chat_id,)).fetchone()
+            history = cursor.execute(_SQL_GET_HEDGE_HISTORY, (chat_id, limit)).fetchall()
+        return position, history
+
     def upsert_holding(self, chat_id: int, symbol: str, asset_type: str, quantity_change: float):
         """Adds or subtracts from a holding's quantity. Inserts if new, deletes if quantity is zero."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        # First, get current quantity
-        cursor.execute("SELECT quantity FROM portfolio_holdings WHERE chat_id = ? AND asset_symbol = ?", (chat_id, symbol))
-        result = cursor.fetchone()
-        current_quantity = result[0] if result else 0.0
-        
-        new_quantity = current_quantity + quantity_change
-        
-        if abs(new_quantity) < 1e-9: # Effectively zero, so we remove it
-            cursor.execute("DELETE FROM portfolio_holdings WHERE chat_id = ? AND asset_symbol = ?", (chat_id, symbol))
-            log.info(f"Removed holding for {chat_id} on {symbol} as quantity is zero.")
+        with self.transaction() as cursor:
+            # Apply the change in SQL, then drop the row if it netted out to (effectively) zero
+            cursor.execute(_SQL_UPSERT_HOLDING, (chat_id, symbol, asset_type, quantity_change))
+            cursor.execute(_SQL_DELETE_ZERO_HOLDING, (chat_id, symbol))
+            removed = cursor.rowcount > 0
+
+        # Hot path: debug-level and lazily formatted so nothing is built unless enabled
+        if removed:
+            log.debug("Removed holding for %s on %s as quantity is zero.", chat_id, symbol)
         else:
-            cursor.execute("""
-                INSERT INTO portfolio_holdings (chat_id, asset_symbol, asset_type, quantity)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(chat_id, asset_symbol) DO UPDATE SET
-                    quantity = ?,
-                    updated_at = CURRENT_TIMESTAMP
-            """, (chat_id, symbol, asset_type, new_quantity, new_quantity))
-            log.info(f"Upserted holding for {chat_id}: {symbol} new quantity {new_quantity:.4f}")
-        
-        conn.commit()
-        conn.close()
-
-    def get_holdings(self, chat_id: int) -> List[Dict[str, Any]]:
+            log.debug("Upserted holding for %s: %s quantity change %.4f", chat_id, symbol, quantity_change)
+
+    def upsert_holdings(self, rows: Iterable[Tuple[int, str, str, float]]):
+        """Applies several (chat_id, symbol, asset_type, quantity_change) holding changes in one commit."""
+        rows = list(rows)
+        with self.transaction() as cursor:
+            cursor.executemany(_SQL_UPSERT_HOLDING, rows)
+            cursor.executemany(_SQL_DELETE_ZERO_HOLDING, [(chat_id, symbol) for chat_id, symbol, _, _ in rows])
+        log.debug("Upserted %d holding changes.", len(rows))
+
+    def get_holdings(self, chat_id: int) -> List[sqlite3.Row]:
         """Retrieves all current holdings for a user."""
-        conn = self._get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM portfolio_holdings WHERE chat_id = ?", (chat_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(_SQL_GET_HOLDINGS, (chat_id,))
+            return cursor.fetchall()
 
     def clear_holdings(self, chat_id: int):
         """Deletes all holdings for a user. Used when monitoring stops."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM portfolio_holdings WHERE chat_id = ?", (chat_id,))
-        conn.commit()
-        conn.close()
-        log.info(f"Cleared all holdings for chat_id: {chat_id}")
-
-# Create a single instance to be used across the application
-db_manager = DatabaseManager(DB_FILE)
\ No newline at end of file
+        with self._lock:
+            self._conn.execute(_SQL_CLEAR_HOLDINGS, (chat_id,))
+        log.debug("Cleared all holdings for chat_id: %s", chat_id)
+
+    def checkpoint(self):
+        """Copies the WAL back into the main database and truncates the -wal file."""
+        with self._lock:
+            busy, wal_pages, moved_pages = self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        log.debug("WAL checkpoint: busy=%s, wal_pages=%s, checkpointed=%s", busy, wal_pages, moved_pages)
+
+    # --- Async API: same operations, executed on the database thread ---
+    async def aupsert_position(self, config: PositionConfig):
+        return await self._run(self.upsert_position, config)
+
+    async def aget_position(self, chat_id: int) -> sqlite3.Row | None:
+        return await self._run(self.get_position, chat_id)
+
+    async def aget_all_positions(self) -> List[sqlite3.Row]:
+        return await self._run(self.get_all_positions)
+
+    async def aget_positions_for_monitoring(self) -> List[MonitoredPosition]:
+        return await self._run(self.get_positions_for_monitoring)
+
+    async def adelete_position(self, chat_id: int):
+        return await self._run(self.delete_position, chat_id)
+
+    async def arecord_hedges(self, hedge_rows, holding_rows):
+        return await self._run(self.record_hedges, hedge_rows, holding_rows)
+
+    async def aget_hedge_history(self, chat_id: int, limit: int = 10) -> List[sqlite3.Row]:
+        return await self._run(self.get_hedge_history, chat_id, limit)
+
+    async def aget_position_and_history(self, chat_id: int, limit: int = 10) -> Tuple[sqlite3.Row | None, List[sqlite3.Row]]:
+        return await self._run(self.get_position_and_history, chat_id, limit)
+
+    async def aupsert_holding(self, chat_id: int, symbol: str, asset_type: str, quantity_change: float):
+        return await self._run(self.upsert_holding, chat_id, symbol, asset_type, quantity_change)
+
+    async def aget_holdings(self, chat_id: int) -> List[sqlite3.Row]:
+        return await self._run(self.get_holdings, chat_id)
+
+    async def aclear_holdings(self, chat_id: int):
+        return await self._run(self.clear_holdings, chat_id)
+
+    async def acheckpoint(self):
+        return await self._run(self.checkpoint)
+
+@functools.cache
+def get_db_manager() -> DatabaseManager:
+    """Returns the single DatabaseManager for this process, creating it on first use."""
+    return DatabaseManager(DB_FILE)
+
+def __getattr__(name: str):
+    # `from database import db_manager` resolves lazily to the shared instance, so
+    # importing helpers from this module never opens the database by itself.
+    if name == 'db_manager':
+        return get_db_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
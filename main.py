@@ -1,13 +1,21 @@
 # This is the full, final, and corrected content for main.py
 
 import logging
-import asyncio
-from datetime import time
+import re
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
+from datetime import time as dt_time
+from zoneinfo import ZoneInfo
+try:
+    import uvloop # libuv-backed event loop; not available on Windows
+except ImportError:
+    uvloop = None
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
-    ConversationHandler, MessageHandler, filters
+    ConversationHandler, MessageHandler, TypeHandler, filters, AIORateLimiter
 )
-from telegram import InputFile
+from telegram import InputFile, Update
 
 # Import all necessary components from our modules
 import config
@@ -37,7 +45,8 @@ from bot.handlers import (
     select_put_strike, select_buy_put, select_sell_put, select_sell_call, select_buy_call,
     
     # Background Jobs
-    risk_check_job, send_daily_summary,
+    risk_check_job, send_daily_summary, wal_checkpoint_job,
+    track_user_activity, sweep_stale_user_data_job,
     
     # Conversation States (constants)
     SELECT_STRATEGY, SELECT_EXPIRY, SELECT_STRIKE, CONFIRM_HEDGE, 
@@ -49,19 +58,72 @@ from database import db_manager
 from reporting import reporting_manager
 
 # --- Setup Centralized Logging ---
+# Handlers only enqueue records (already formatted by the QueueHandler); a background
+# listener thread does the console and file writes so handlers never block on disk I/O.
+log_queue = queue.Queue(-1)
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("bot_activity.log")]
+    handlers=[QueueHandler(log_queue)]
 )
+log_listener = QueueListener(log_queue, logging.StreamHandler(), logging.FileHandler("bot_activity.log"))
+log_listener.start()
+atexit.register(log_listener.stop) # Flushes any queued records on exit
 logging.getLogger("httpx").setLevel(logging.WARNING)
 log = logging.getLogger(__name__)
 
+# Must run before the Application creates its event loop
+if uvloop is not None:
+    uvloop.install()
+
+# Pinned to UTC so the schedule doesn't depend on the server's locale
+DAILY_SUMMARY_TIME = dt_time(8, 0, tzinfo=ZoneInfo("UTC"))
+
+# Callback-data patterns for the options conversation, compiled once and shared
+STRATEGY_PATTERN = re.compile(r"^strategy_")
+EXPIRY_PATTERN = re.compile(r"^expiry_")
+STRIKE_PATTERN = re.compile(r"^strike_")
+CONFIRM_HEDGE_PATTERN = re.compile(r"^confirm_hedge")
+CANCEL_PATTERN = re.compile(r"^cancel")
+
+# Tickers streamed from startup so the first risk check already reads prices from memory
+PRICE_STREAMS = (('bybit', 'BTC/USDT'), ('bybit', 'BTC/USDT:USDT'))
+
+# (command, handler) pairs for all standard, non-conversation commands
+COMMAND_HANDLERS = (
+    ("start", start_command), ("help", help_command), ("monitor_risk", monitor_risk_command),
+    ("stop_monitoring", stop_monitoring_command), ("auto_hedge", auto_hedge_command),
+    ("set_large_trade_limit", set_large_trade_limit_command), ("hedge_status", hedge_status_command),
+    ("hedge_history", hedge_history_command), ("chart", chart_command), ("portfolio_risk", portfolio_risk_command),
+    ("stress_test", stress_test_command), ("export_data", export_data_command), ("price", price_command),
+    ("ml_mode", ml_mode_command),
+)
+
+
+async def post_init(application: Application) -> None:
+    """Runs once the event loop is up, before polling starts."""
+    # Market lists are large; fetch them in the background rather than on the first user request
+    application.create_task(data_fetcher_instance.warm_markets())
+    for exchange_name, symbol in PRICE_STREAMS:
+        data_fetcher_instance.subscribe(exchange_name, symbol)
+
+
+async def post_shutdown(application: Application) -> None:
+    """Runs after polling stops, while the event loop is still open."""
+    await data_fetcher_instance.close_connections()
+
 
 def main() -> None:
     """The main function to set up and run the entire bot application."""
     log.info("Starting bot...")
-    application = Application.builder().token(config.TELEGRAM_TOKEN).build()
+    # Throttle outgoing requests client-side (Telegram allows ~30 msg/s overall and
+    # 20 msg/min per group) so bursts of alerts queue instead of drawing 429 back-offs.
+    rate_limiter = AIORateLimiter(
+        overall_max_rate=30, overall_time_period=1,
+        group_max_rate=20, group_time_period=60,
+        max_retries=3
+    )
+    application = Application.builder().token(config.TELEGRAM_TOKEN).rate_limiter(rate_limiter).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # --- Conversation Handler for Adjusting Thresholds ---
     adjust_conv_handler = ConversationHandler(
@@ -71,6 +133,7 @@ def main() -> None:
             ADJUST_VAR: [MessageHandler(filters.TEXT & ~filters.COMMAND, adjust_var_received)],
         },
         fallbacks=[CommandHandler("cancel", cancel_adjustment)],
+        per_chat=True, per_user=True, per_message=False,
         conversation_timeout=300
     )
     
@@ -78,35 +141,31 @@ def main() -> None:
     options_conv_handler = ConversationHandler(
         entry_points=[CommandHandler("hedge_options", hedge_options_command)],
         states={
-            SELECT_STRATEGY: [CallbackQueryHandler(select_strategy, pattern="^strategy_")],
-            SELECT_EXPIRY: [CallbackQueryHandler(select_expiry, pattern="^expiry_")],
-            SELECT_STRIKE: [CallbackQueryHandler(select_strike, pattern="^strike_")],
-            SELECT_PUT_STRIKE: [CallbackQueryHandler(select_put_strike, pattern="^strike_")],
-            SELECT_BUY_PUT: [CallbackQueryHandler(select_buy_put, pattern="^strike_")],
-            SELECT_SELL_PUT: [CallbackQueryHandler(select_sell_put, pattern="^strike_")],
-            SELECT_SELL_CALL: [CallbackQueryHandler(select_sell_call, pattern="^strike_")],
-            SELECT_BUY_CALL: [CallbackQueryHandler(select_buy_call, pattern="^strike_")],
-            CONFIRM_HEDGE: [CallbackQueryHandler(confirm_hedge, pattern="^confirm_hedge")],
-            CONFIRM_CONDOR: [CallbackQueryHandler(confirm_hedge, pattern="^confirm_hedge")],
+            SELECT_STRATEGY: [CallbackQueryHandler(select_strategy, pattern=STRATEGY_PATTERN)],
+            SELECT_EXPIRY: [CallbackQueryHandler(select_expiry, pattern=EXPIRY_PATTERN)],
+            SELECT_STRIKE: [CallbackQueryHandler(select_strike, pattern=STRIKE_PATTERN)],
+            SELECT_PUT_STRIKE: [CallbackQueryHandler(select_put_strike, pattern=STRIKE_PATTERN)],
+            SELECT_BUY_PUT: [CallbackQueryHandler(select_buy_put, pattern=STRIKE_PATTERN)],
+            SELECT_SELL_PUT: [CallbackQueryHandler(select_sell_put, pattern=STRIKE_PATTERN)],
+            SELECT_SELL_CALL: [CallbackQueryHandler(select_sell_call, pattern=STRIKE_PATTERN)],
+            SELECT_BUY_CALL: [CallbackQueryHandler(select_buy_call, pattern=STRIKE_PATTERN)],
+            CONFIRM_HEDGE: [CallbackQueryHandler(confirm_hedge, pattern=CONFIRM_HEDGE_PATTERN)],
+            CONFIRM_CONDOR: [CallbackQueryHandler(confirm_hedge, pattern=CONFIRM_HEDGE_PATTERN)],
         },
-        fallbacks=[CallbackQueryHandler(cancel_conversation, pattern="^cancel")],
+        fallbacks=[CallbackQueryHandler(cancel_conversation, pattern=CANCEL_PATTERN)],
+        per_chat=True, per_user=True, per_message=False,
         conversation_timeout=600
     )
 
+    # Record every user's last activity ahead of all other handlers (group -1)
+    application.add_handler(TypeHandler(Update, track_user_activity), group=-1)
+
     # Register conversation handlers first to ensure they have priority
     application.add_handler(adjust_conv_handler)
     application.add_handler(options_conv_handler)
 
     # --- Register ALL Standard Command Handlers ---
-    command_handlers = {
-        "start": start_command, "help": help_command, "monitor_risk": monitor_risk_command,
-        "stop_monitoring": stop_monitoring_command, "auto_hedge": auto_hedge_command,
-        "set_large_trade_limit": set_large_trade_limit_command, "hedge_status": hedge_status_command,
-        "hedge_history": hedge_history_command, "chart": chart_command, "portfolio_risk": portfolio_risk_command,
-        "stress_test": stress_test_command, "export_data": export_data_command, "price": price_command,
-        "ml_mode": ml_mode_command # Add the new ML command
-    }
-    for command, handler in command_handlers.items():
+    for command, handler in COMMAND_HANDLERS:
         application.add_handler(CommandHandler(command, handler))
     
     # --- Register the General Callback Handler for non-conversation buttons ---
@@ -115,20 +174,15 @@ def main() -> None:
     # --- Schedule Background Jobs ---
     job_queue = application.job_queue
     job_queue.run_repeating(risk_check_job, interval=60, first=10)
-    job_queue.run_daily(send_daily_summary, time=time(hour=8, minute=0))
-    log.info("Background jobs (risk check, daily summary) have been scheduled.")
+    job_queue.run_daily(send_daily_summary, time=DAILY_SUMMARY_TIME)
+    job_queue.run_repeating(wal_checkpoint_job, interval=3600, first=600)
+    job_queue.run_repeating(sweep_stale_user_data_job, interval=3600, first=3600)
+    log.info("Background jobs (risk check, daily summary, WAL checkpoint, state sweep) have been scheduled.")
 
     # --- Start the Bot ---
     log.info("Bot is polling for updates...")
+    # Exchange connections are closed by post_shutdown before the loop is closed
     application.run_polling()
-
-    # --- Graceful Shutdown ---
-    log.info("Bot is shutting down...")
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        loop.create_task(data_fetcher_instance.close_connections())
-    else:
-        loop.run_until_complete(data_fetcher_instance.close_connections())
     log.info("Shutdown complete.")
 
 
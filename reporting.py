@@ -1,54 +1,55 @@
 import pandas as pd
 import io
-import json
-from database import db_manager
+import csv
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from database import unpack_details
+
+# Source column -> header label, in report order
+POSITION_REPORT_COLUMNS = {
+    'chat_id': 'User ID',
+    'asset': 'Asset',
+    'size': 'Position Size',
+    'delta_threshold': 'Delta Threshold (USD)',
+    'var_threshold': 'VaR Threshold (USD)',
+    'large_trade_threshold': 'Large Trade Limit (USD)',
+    'auto_hedge_enabled': 'Auto-Hedge Enabled',
+    'daily_summary_enabled': 'Daily Summary Enabled',
+}
 
 class ReportingManager:
-    def generate_position_report_csv(self, chat_id: int) -> io.StringIO | None:
+    def generate_position_report_csv(self, position_data) -> io.StringIO | None:
         """
         Generates a CSV report of the user's current position and risk settings.
         This serves as a basic risk disclosure document.
+        position_data is the user's positions row (see get_position_and_history).
         """
-        position_data = db_manager.get_position(chat_id)
         if not position_data:
             return None
         
-        # Convert the dict to a pandas DataFrame for easy CSV export
-        df = pd.DataFrame([position_data])
-        
-        # Reorder and rename columns for clarity
-        report_df = df[[
-            'chat_id', 'asset', 'size', 'delta_threshold', 'var_threshold',
-            'large_trade_threshold', 'auto_hedge_enabled', 'daily_summary_enabled'
-        ]]
-        report_df.columns = [
-            'User ID', 'Asset', 'Position Size', 'Delta Threshold (USD)', 'VaR Threshold (USD)',
-            'Large Trade Limit (USD)', 'Auto-Hedge Enabled', 'Daily Summary Enabled'
-        ]
-        
+        # A single row doesn't need a DataFrame; write it straight to CSV
         output = io.StringIO()
-        report_df.to_csv(output, index=False)
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(POSITION_REPORT_COLUMNS.values())
+        writer.writerow([position_data[key] for key in POSITION_REPORT_COLUMNS])
         output.seek(0)
         return output
 
-    def generate_trade_history_csv(self, chat_id: int) -> io.StringIO | None:
+    def generate_trade_history_csv(self, history_data) -> io.BytesIO | None:
         """
         Generates a CSV report of all historical (simulated) trades for a user.
         This serves as a trade ledger for compliance purposes.
+        history_data is the user's hedge_history rows (see get_position_and_history).
         """
-        history_data = db_manager.get_hedge_history(chat_id)
         if not history_data:
             return None
         
-        # Normalize the JSON 'details' column into separate columns
-        flat_data = []
-        for record in history_data:
-            details = json.loads(record['details'])
-            record.update(details)
-            del record['details'] # Remove the original JSON string
-            flat_data.append(record)
-        
-        df = pd.DataFrame(flat_data)
+        # Normalize the packed 'details' column into separate columns in one pass
+        base_df = pd.DataFrame(history_data, columns=history_data[0].keys())
+        # venue and total_cost_usd already come back as native columns
+        details_df = pd.json_normalize(base_df['details'].map(unpack_details).tolist())
+        details_df = details_df.drop(columns=['venue', 'total_cost_usd'], errors='ignore')
+        df = pd.concat([base_df.drop(columns=['details']), details_df], axis=1)
         
         # Select and reorder columns for the final report
         report_df = df[[
@@ -60,8 +61,9 @@ class ReportingManager:
             'Total Cost (USD)', 'Slippage (USD)', 'Fees (USD)', 'Execution Venue'
         ]
 
-        output = io.StringIO()
-        report_df.to_csv(output, index=False)
+        # Arrow's native CSV writer encodes straight to bytes, ready for upload
+        output = io.BytesIO()
+        pacsv.write_csv(pa.Table.from_pandas(report_df, preserve_index=False), output)
         output.seek(0)
         return output
 
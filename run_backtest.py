@@ -1,12 +1,23 @@
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from backtest.backtester import Backtester
 
+# Explicit column types so the reader doesn't have to infer them
+OHLCV_DTYPES = {'open': 'float64', 'high': 'float64', 'low': 'float64', 'close': 'float64', 'volume': 'float64'}
+
+def load_ohlcv(path):
+    """Reads an OHLCV CSV written by scripts/download_data.py using Arrow's multithreaded parser."""
+    return pd.read_csv(path, engine='pyarrow', dtype=OHLCV_DTYPES, parse_dates=['timestamp'])
+
 def main():
     # --- 1. Load Data ---
     print("Loading historical data...")
     try:
-        spot_data = pd.read_csv("./data/BTC_USDT_1d.csv", parse_dates=['timestamp'])
-        perp_data = pd.read_csv("./data/BTC_USDT_USDT_1d.csv", parse_dates=['timestamp'])
+        # Both files are parsed concurrently; Arrow releases the GIL while reading
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            spot_future = executor.submit(load_ohlcv, "./data/BTC_USDT_1d.csv")
+            perp_future = executor.submit(load_ohlcv, "./data/BTC_USDT_USDT_1d.csv")
+            spot_data, perp_data = spot_future.result(), perp_future.result()
     except FileNotFoundError:
         print("Error: Data files not found. Please run 'scripts/download_data.py' first.")
         return
@@ -1,10 +1,16 @@
 import ccxt.pro as ccxt
+import numpy as np
 import pandas as pd
+import argparse
 import os
 import asyncio
 
-async def download_historical_data(symbol, timeframe, start_date_str, output_folder="data"):
-    """Downloads historical OHLCV data and saves it to a CSV file."""
+async def download_historical_data(symbol, timeframe, start_date_str, output_folder="data", strict=False):
+    """Downloads historical OHLCV data and saves it to a CSV file.
+
+    Gaps in the series are written next to it as <file>.gaps.csv; with strict=True a
+    failed window or a gap raises instead and nothing is saved.
+    """
     
     # Use current directory + data folder
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,62 +34,104 @@ async def download_historical_data(symbol, timeframe, start_date_str, output_fol
     print(f"Downloading data for {symbol} since {start_date_str}...")
     print(f"Will save to: {filename}")
 
-    all_ohlcv = []
-    request_count = 0
+    # Each request returns up to 1000 bars, so the windows can be computed up front and
+    # fetched concurrently; ccxt's rate limiter throttles them, the semaphore caps fan-out.
+    bars_per_request = 1000
+    timeframe_ms = exchange.parse_timeframe(timeframe) * 1000
+    window_ms = timeframe_ms * bars_per_request
     max_requests = 2000  # Safety limit
-    
-    while start_timestamp < exchange.milliseconds() and request_count < max_requests:
-        try:
-            ohlcv = await exchange.fetch_ohlcv(symbol, timeframe, since=start_timestamp, limit=1000)
-            request_count += 1
-            
-            if not ohlcv:
-                print("No more data available")
-                break
-                
-            all_ohlcv.extend(ohlcv)
-            start_timestamp = ohlcv[-1][0] + exchange.parse_timeframe(timeframe) * 1000
-            
-            print(f"Request {request_count}: Fetched {len(ohlcv)} bars. Total: {len(all_ohlcv)}. Now at {exchange.iso8601(start_timestamp)}")
-            
-            # Small delay to avoid rate limiting
-            await asyncio.sleep(0.1)
-            
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            # Wait a bit longer on error and try to continue
-            await asyncio.sleep(1)
-            break
-    
-    await exchange.close()
+    max_attempts = 3
+    starts = list(range(start_timestamp, exchange.milliseconds(), window_ms))[:max_requests]
+    semaphore = asyncio.Semaphore(8)
+
+    async def fetch_page(since):
+        """One fetch_ohlcv call, retried with backoff on transient errors (e.g. 429s)."""
+        for attempt in range(1, max_attempts + 1):
+            try:
+                return await exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=bars_per_request)
+            except Exception as e:
+                print(f"Attempt {attempt}/{max_attempts} fetching from {exchange.iso8601(since)} failed: {e}")
+                if attempt == max_attempts:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+
+    async def fetch_window(since):
+        """Fetches the window's bars, paging on if the venue returns fewer than requested."""
+        window_end = since + window_ms
+        bars = []
+        async with semaphore:
+            cursor = since
+            while cursor < window_end:
+                page = [bar for bar in await fetch_page(cursor) if bar[0] < window_end]
+                if not page:
+                    break
+                bars.extend(page)
+                cursor = page[-1][0] + timeframe_ms
+        print(f"Fetched {len(bars)} bars from {exchange.iso8601(since)}")
+        return bars
+
+    print(f"Issuing {len(starts)} requests...")
+    try:
+        results = await asyncio.gather(*(fetch_window(since) for since in starts), return_exceptions=True)
+    finally:
+        await exchange.close()
+
+    failed = [since for since, result in zip(starts, results) if isinstance(result, Exception)]
+    if failed and strict:
+        raise RuntimeError(f"{len(failed)} windows for {symbol} failed after {max_attempts} attempts, first at {exchange.iso8601(failed[0])}")
+    for since in failed:
+        print(f"⚠️ Window from {exchange.iso8601(since)} failed after {max_attempts} attempts, it will show up as a gap")
+    results = [[] if isinstance(result, Exception) else result for result in results]
+
+    all_ohlcv = [bar for ohlcv in results for bar in ohlcv]
     
     if all_ohlcv:
         df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         
         # Remove duplicates that might occur
         df = df.drop_duplicates(subset=['timestamp'])
         df = df.sort_values('timestamp')
+
+        # A hole in the series would silently skew the backtest and model training, so
+        # every step between consecutive bars longer than one bar is reported as a gap.
+        timestamps = df['timestamp'].to_numpy(dtype='int64')
+        steps = np.diff(timestamps)
+        gap_idx = np.flatnonzero(steps > timeframe_ms)
+        gaps = pd.DataFrame({
+            'gap_start': pd.to_datetime(timestamps[gap_idx] + timeframe_ms, unit='ms'),
+            'gap_end': pd.to_datetime(timestamps[gap_idx + 1] - timeframe_ms, unit='ms'),
+            'missing_bars': steps[gap_idx] // timeframe_ms - 1,
+        })
+        gaps_filename = f"{os.path.splitext(filename)[0]}.gaps.csv"
+        if len(gaps) and strict:
+            raise RuntimeError(f"{len(gaps)} gaps in {symbol} data, first from {gaps['gap_start'].iloc[0]} to {gaps['gap_end'].iloc[0]}")
+
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         
         df.to_csv(filename, index=False)
         print(f"✅ Data saved to {filename}")
         print(f"📊 Total records: {len(df)}")
         print(f"📅 Date range: {df['timestamp'].min()} to {df['timestamp'].max()}")
         print(f"💾 File size: {os.path.getsize(filename):,} bytes")
+        if len(gaps):
+            gaps.to_csv(gaps_filename, index=False)
+            print(f"⚠️ {len(gaps)} gaps ({gaps['missing_bars'].sum()} missing bars) written to {gaps_filename}")
+        elif os.path.exists(gaps_filename):
+            os.remove(gaps_filename)
         print("-" * 50)
     else:
         print(f"❌ No data downloaded for {symbol}")
 
-async def main():
+async def main(strict=False):
     try:
         print("Starting data download...")
         print("=" * 50)
         
-        # Download spot data
-        await download_historical_data("BTC/USDT", "1d", "2023-01-01T00:00:00Z")
-        
-        # Download perpetual futures data
-        await download_historical_data("BTC/USDT:USDT", "1d", "2023-01-01T00:00:00Z")
+        # Download spot and perpetual futures data concurrently
+        await asyncio.gather(
+            download_historical_data("BTC/USDT", "1d", "2023-01-01T00:00:00Z", strict=strict),
+            download_historical_data("BTC/USDT:USDT", "1d", "2023-01-01T00:00:00Z", strict=strict),
+        )
         
         print("🎉 All downloads completed!")
         
@@ -93,4 +141,7 @@ async def main():
         print(f"❌ An error occurred in main: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download historical OHLCV data for the backtests.")
+    parser.add_argument("--strict", action="store_true", help="fail on a failed window or a gap instead of reporting it")
+    args = parser.parse_args()
+    asyncio.run(main(strict=args.strict))
\ No newline at end of file
@@ -5,13 +5,59 @@ import joblib
 import asyncio
 import os
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
+from numba import njit
 
 # The path to the core directory where the model will be saved
 MODEL_OUTPUT_PATH = "../core/garch_model.pkl"
 
+# Re-estimate the GARCH parameters every this many days of the rolling evaluation
+REFIT_EVERY = 25
+
 # We can re-use the download script logic if needed, but for now we assume data exists
 # from download_data import download_historical_data
 
+@njit(cache=True, fastmath=True)
+def garch_variance_path(resids, omega, alpha, beta, sigma2_0):
+    """
+    GARCH(1,1) one-step-ahead variance forecasts with fixed parameters.
+    out[i] is the variance forecast made after observing resids[i], where sigma2_0
+    is the conditional variance of the day resids[0] was observed.
+    """
+    n = resids.size
+    out = np.empty(n)
+    sigma2 = sigma2_0
+    for i in range(n):
+        sigma2 = omega + alpha * resids[i] ** 2 + beta * sigma2
+        out[i] = sigma2
+    return out
+
+def _forecast_block(block_start, returns_array, split_index, n_forecasts, starting_values):
+    """
+    Fits GARCH(1,1) once at the start of a block of REFIT_EVERY days and forecasts
+    each day in the block with those frozen parameters.
+    """
+    last_obs = split_index + block_start
+    block_len = min(REFIT_EVERY, n_forecasts - block_start)
+
+    # Define the GARCH(1,1) model blueprint. Using a Student's-t distribution ('t')
+    # is often more robust for financial data than a normal distribution.
+    # last_obs bounds the estimation sample without copying a slice of the data.
+    model = arch_model(returns_array, vol='Garch', p=1, q=1, dist='t')
+
+    # Warm-start from the initial fit; neighbouring windows have nearly identical parameters.
+    results = model.fit(last_obs=last_obs, starting_values=starting_values, disp='off', show_warning=False)
+
+    # With the parameters frozen, every forecast in the block is just the variance
+    # recursion run forward from the last in-sample day, so it is done in compiled code.
+    mu, omega, alpha, beta = results.params[['mu', 'omega', 'alpha[1]', 'beta[1]']]
+    resids = returns_array[last_obs - 1:last_obs - 1 + block_len] - mu
+    sigma2_0 = results.conditional_volatility[last_obs - 1] ** 2
+    variances = garch_variance_path(resids, omega, alpha, beta, sigma2_0)
+
+    # Return the standard deviation (sqrt of variance) for each day in the block
+    return np.sqrt(variances)
+
 async def train_and_evaluate_model():
     """
     Downloads data, trains a GARCH(1,1) model, evaluates its out-of-sample
@@ -32,10 +78,13 @@ async def train_and_evaluate_model():
         print("Please run 'download_data.py' first to download a long history (e.g., since 2020).")
         return
 
-    # Calculate daily returns in percentage points for better model convergence
-    returns = 100 * data['close'].pct_change().dropna()
+    # Calculate daily returns in percentage points for better model convergence.
+    # Done on the raw array: the evaluation below only ever needs NumPy slices of it.
+    close = data['close'].to_numpy()
+    returns_array = 100.0 * (close[1:] / close[:-1] - 1.0)
+    returns_index = data.index[1:]
     
-    if len(returns) < 500:
+    if len(returns_array) < 500:
         print("❌ Error: Not enough historical data to perform a meaningful evaluation. Please download more data.")
         return
 
@@ -43,42 +92,28 @@ async def train_and_evaluate_model():
     print("\n--- Starting Out-of-Sample Evaluation (this may take a few minutes) ---")
     
     # Split data: 80% for the initial training set, 20% for testing (forecasting)
-    split_index = int(len(returns) * 0.8)
+    split_index = int(len(returns_array) * 0.8)
     
-    predictions = []
-    
-    # Use a rolling window forecast. At each step, we re-train the model with one new data point.
-    for i in range(len(returns) - split_index):
-        current_train_data = returns.iloc[:(split_index + i)]
-        
-        # Define the GARCH(1,1) model blueprint. Using a Student's-t distribution ('t')
-        # is often more robust for financial data than a normal distribution.
-        model = arch_model(current_train_data, vol='Garch', p=1, q=1, dist='t')
-        
-        # Fit the model and get the results object. 'disp='off'' suppresses verbose output in the loop.
-        results = model.fit(disp='off')
-        
-        # Call forecast() on the FITTED results object to predict the next step.
-        forecast = results.forecast(horizon=1)
-        
-        # Extract the forecasted variance for the next day
-        predicted_variance = forecast.variance.iloc[-1, 0]
-        
-        # Append the standard deviation (sqrt of variance) to our predictions list
-        predictions.append(np.sqrt(predicted_variance))
-
-        # Print progress update every 50 steps
-        if (i + 1) % 50 == 0:
-            print(f"Rolling forecast... {i + 1}/{len(returns) - split_index} complete.")
+    # Use a rolling window forecast. Re-fitting every day barely moves the coefficients, so
+    # the parameters are re-estimated every REFIT_EVERY days and held fixed in between.
+    # The blocks are independent, so they are spread across all CPU cores.
+    n_forecasts = len(returns_array) - split_index
+    initial_params = arch_model(returns_array, vol='Garch', p=1, q=1, dist='t').fit(
+        last_obs=split_index, disp='off', show_warning=False
+    ).params.values
+
+    blocks = Parallel(n_jobs=os.cpu_count(), backend='loky', verbose=5)(
+        delayed(_forecast_block)(block_start, returns_array, split_index, n_forecasts, initial_params)
+        for block_start in range(0, n_forecasts, REFIT_EVERY)
+    )
+    predictions = np.concatenate(blocks)
 
     # Create a DataFrame to hold the results for easy plotting and analysis
-    test_set = returns.iloc[split_index:]
     results_df = pd.DataFrame({
-        'predicted_vol': predictions
-    }, index=test_set.index)
-    
-    # Use the absolute value of returns as a proxy for actual daily volatility
-    results_df['actual_vol'] = np.abs(test_set)
+        'predicted_vol': predictions,
+        # Use the absolute value of returns as a proxy for actual daily volatility
+        'actual_vol': np.abs(returns_array[split_index:])
+    }, index=returns_index[split_index:])
     
     # --- 3. Plot the Evaluation Results ---
     print("\n--- Generating Forecast Evaluation Plot ---")
@@ -95,6 +130,8 @@ async def train_and_evaluate_model():
 
     # --- 4. Train Final Model on ALL Data and Save ---
     print("\n--- Training Final Model on Full Dataset ---")
+    # Fit on a dated Series so the saved results keep their index (the risk engine reads .iloc[-1])
+    returns = pd.Series(returns_array, index=returns_index, name='close')
     final_model = arch_model(returns, vol='Garch', p=1, q=1, dist='t')
     final_results = final_model.fit(update_freq=10, disp='iter')
     
@@ -102,7 +139,8 @@ async def train_and_evaluate_model():
     print(final_results.summary())
 
     # Save the fitted model object, which contains all learned parameters.
-    joblib.dump(final_results, MODEL_OUTPUT_PATH)
+    # LZ4 keeps the file small while decompressing fast enough not to slow the bot's startup
+    joblib.dump(final_results, MODEL_OUTPUT_PATH, compress=('lz4', 3))
     print(f"\n✅ Final GARCH model trained and saved successfully to {MODEL_OUTPUT_PATH}")
 
 async def main():
@@ -1,9 +1,49 @@
-import ccxt.async_support as ccxt
+import ccxt.pro as ccxt # websocket-capable subclasses of the async REST clients
+import aiohttp
+import asyncio
+import ssl
+import certifi
+import json
+import orjson
 import logging
+import os
+import re
+import time
+import numpy as np
 import pandas as pd
 
 log = logging.getLogger(__name__)
 
+# Storage dtype for OHLCV price/volume columns. Exchange ticks carry well under 7
+# significant digits, so single precision halves the cache's memory; code that needs
+# double precision (e.g. VaR P&L) casts the columns it uses back to float64.
+OHLCV_DTYPE = np.float32
+
+# Market lists from the last run, so a fresh process can price symbols without first
+# downloading every exchange's full market list (ccxt loads it lazily on the first call)
+MARKETS_SNAPSHOT_DIR = os.path.expanduser("~/.cache/hedgebot")
+
+# orjson turns integers wider than 64 bits into floats; any run of 20+ digits might be one
+_LONG_DIGIT_RUN = re.compile(r'\d{20}')
+
+def _orjson_parse_json(http_response):
+    """
+    Drop-in for ccxt's Exchange.parse_json that decodes REST responses with orjson.
+    Responses orjson would reject (e.g. NaN) or could lose precision on go to the
+    stdlib parser ccxt itself uses, so the result is always what ccxt would get.
+    """
+    if not isinstance(http_response, str) or http_response[:1] not in ('{', '['):
+        return None
+    if not _LONG_DIGIT_RUN.search(http_response):
+        try:
+            return orjson.loads(http_response)
+        except orjson.JSONDecodeError:
+            pass
+    try:
+        return json.loads(http_response)
+    except ValueError:
+        return None
+
 class DataFetcher:
     def __init__(self):
         self.exchanges = {
@@ -11,21 +51,267 @@ class DataFetcher:
             'deribit': ccxt.deribit(),
             'okx': ccxt.okx(), # for smart order routing
         }
+        # ccxt decodes every response (OHLCV pages, order books, tickers) with the stdlib json
+        for exchange in self.exchanges.values():
+            exchange.parse_json = _orjson_parse_json
+        self._load_market_snapshots()
+        # Cache of recent OHLCV series so a leg shared by several calls (e.g. the spot
+        # series used in every beta pair) is only downloaded once per TTL window. Entries
+        # also expire when a new candle opens, and a longer series serves shorter requests.
+        # Format: {("bybit", "BTC/USDT", "1d"): {"df": DataFrame, "limit": 90, "expires_at": 167...}}
+        self.ohlcv_cache = {}
+        self.ohlcv_cache_duration_seconds = 60  # Only the open candle changes within a bar
+        # Deribit's option listings only change when new expiries are added, so the market
+        # list is reloaded hourly and the per-currency instrument lists are built once per load.
+        # Format: {"BTC": ["BTC/USD:BTC-241129-70000-P", ...]}
+        self.option_instruments_cache = {}
+        self.markets_loaded_at = 0.0
+        self.markets_cache_duration_seconds = 60 * 60
+        # Short-lived cache for option tickers: users stepping through the strike menus
+        # ask for the same instrument several times within a few seconds.
+        # Format: {"BTC-29NOV24-70000-P": {"ticker": {...}, "timestamp": 167...}}
+        self.option_ticker_cache = {}
+        self.option_ticker_cache_duration_seconds = 1
+        self.option_ticker_cache_max_entries = 256
+        # One pooled HTTP session shared by every exchange, created on first use because
+        # aiohttp needs a running event loop (this instance is built at import time).
+        self.session = None
+        self.closed = False
+        # Latest prices pushed by websocket ticker streams, one background task per symbol.
+        # Format: {("bybit", "BTC/USDT"): (65000.5, 167...)}
+        self.ticker_cache = {}
+        self.ticker_tasks = {}
+        self.ticker_stale_after_seconds = 30 # Fall back to REST if a stream goes quiet
+        # REST prices fetched while a stream isn't live, reused for back-to-back calls
+        # Format: {("bybit", "BTC/USDT"): (65000.5, 167...)}
+        self.price_cache = {}
+        self.price_cache_duration_seconds = 1
+        # In-flight REST price requests, so concurrent callers share one round-trip
+        # Format: {("bybit", "BTC/USDT"): asyncio.Task}
+        self.price_requests = {}
         log.info("DataFetcher initialized with exchanges: %s", list(self.exchanges.keys()))
 
+    def _ensure_session(self):
+        """Creates the shared aiohttp session and hands it to all exchanges, once."""
+        if self.session is not None:
+            return
+        # Same CA bundle ccxt would use for its own sessions
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        connector = aiohttp.TCPConnector(
+            ssl=ssl_context, limit=100, limit_per_host=20, ttl_dns_cache=300,
+            keepalive_timeout=75, enable_cleanup_closed=True
+        )
+        # trust_env honours HTTP(S)_PROXY settings for every exchange at once
+        self.session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        for exchange in self.exchanges.values():
+            exchange.session = self.session
+            exchange.own_session = False # ccxt must not close a session it didn't create
+
+    def _load_market_snapshots(self):
+        """Seeds each exchange with the market list saved by warm_markets on a previous run."""
+        for name, exchange in self.exchanges.items():
+            path = os.path.join(MARKETS_SNAPSHOT_DIR, f"markets_{name}.json")
+            try:
+                # Plain JSON rather than pickle: loading a file from a user-writable cache
+                # directory must not be able to run code
+                with open(path, 'rb') as f:
+                    snapshot = orjson.loads(f.read())
+                exchange.set_markets(snapshot['markets'], snapshot['currencies'])
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                log.warning(f"Ignoring unreadable market snapshot {path}: {e}")
+
+    @staticmethod
+    def _save_market_snapshot(name: str, markets: dict, currencies: dict):
+        """Saves one exchange's markets as JSON for _load_market_snapshots."""
+        os.makedirs(MARKETS_SNAPSHOT_DIR, exist_ok=True)
+        path = os.path.join(MARKETS_SNAPSHOT_DIR, f"markets_{name}.json")
+        # Written beside the target and swapped in, so a crash never leaves a torn file
+        with open(path + '.tmp', 'wb') as f:
+            f.write(orjson.dumps({'markets': markets, 'currencies': currencies}, option=orjson.OPT_NON_STR_KEYS))
+        os.replace(path + '.tmp', path)
+
+    async def warm_markets(self):
+        """
+        Loads every exchange's market list in the background and snapshots it to disk.
+        Until it finishes, requests are served from the previous run's snapshot (if any).
+        """
+        self._ensure_session()
+        results = await asyncio.gather(
+            *(exchange.load_markets(reload=True) for exchange in self.exchanges.values()),
+            return_exceptions=True
+        )
+        for (name, exchange), result in zip(self.exchanges.items(), results):
+            if isinstance(result, Exception):
+                log.warning(f"Could not load markets for {name}: {result}")
+                continue
+            if name == 'deribit':
+                self.markets_loaded_at = time.time()
+                self.option_instruments_cache = {}
+            try:
+                await asyncio.to_thread(self._save_market_snapshot, name, exchange.markets, exchange.currencies)
+            except Exception as e:
+                log.warning(f"Could not save market snapshot for {name}: {e}")
+        log.info("Exchange markets loaded.")
+
+    async def _ticker_loop(self, exchange_name: str, symbol: str):
+        """Keeps ticker_cache updated from the exchange's websocket ticker stream."""
+        exchange = self.exchanges[exchange_name]
+        key = (exchange_name, symbol)
+        try:
+            while True:
+                try:
+                    ticker = await exchange.watch_ticker(symbol)
+                    self.ticker_cache[key] = (ticker['last'], time.time())
+                except asyncio.CancelledError:
+                    raise
+                except ccxt.BadSymbol as e:
+                    # Retrying can't fix an unknown symbol
+                    log.error(f"Stopping ticker stream for {symbol} on {exchange_name}: {e}")
+                    return
+                except Exception as e:
+                    log.warning(f"Ticker stream for {symbol} on {exchange_name} failed, reconnecting: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            self.ticker_tasks.pop(key, None)
+            self.ticker_cache.pop(key, None)
+
+    def subscribe(self, exchange_name: str, symbol: str):
+        """Starts streaming a symbol's ticker into ticker_cache; a no-op if it already is."""
+        exchange_name = exchange_name.lower()
+        key = (exchange_name, symbol)
+        if key in self.ticker_tasks or not self.exchanges[exchange_name].has.get('watchTicker'):
+            return
+        self._ensure_session()
+        self.ticker_tasks[key] = asyncio.create_task(self._ticker_loop(exchange_name, symbol))
+        log.info(f"Subscribed to {symbol} ticker stream on {exchange_name}.")
+
     async def get_price(self, exchange_name: str, symbol: str) -> float | None:
         exchange_name = exchange_name.lower()
         if exchange_name not in self.exchanges:
             log.error(f"Exchange '{exchange_name}' not supported.")
             return None
+        self._ensure_session()
+
+        # Serve from the websocket stream when the symbol is subscribed (see PRICE_STREAMS
+        # in main.py) and live. Other symbols are answered over REST: user-supplied symbols
+        # must not open streams that would run for the life of the process.
+        key = (exchange_name, symbol)
+        cached = self.ticker_cache.get(key)
+        if cached and time.time() - cached[1] < self.ticker_stale_after_seconds:
+            return cached[0]
+        cached = self.price_cache.get(key)
+        if cached and time.time() - cached[1] < self.price_cache_duration_seconds:
+            return cached[0]
+
+        task = self.price_requests.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_price(exchange_name, symbol))
+            self._track_price_request(exchange_name, [symbol], task)
+        # Shielded so one caller being cancelled doesn't cancel the request for the others
+        return (await asyncio.shield(task)).get(symbol)
+
+    def _track_price_request(self, exchange_name: str, symbols: list, task: asyncio.Task):
+        """Registers an in-flight REST price task under every symbol it will price."""
+        keys = [(exchange_name, symbol) for symbol in symbols]
+        for key in keys:
+            self.price_requests[key] = task
+
+        def forget(_):
+            for key in keys:
+                if self.price_requests.get(key) is task:
+                    del self.price_requests[key]
+        task.add_done_callback(forget)
+
+    async def _fetch_price(self, exchange_name: str, symbol: str) -> dict[str, float]:
+        """REST fallback for get_price. Returns {symbol: price}, empty on failure."""
         exchange = self.exchanges[exchange_name]
         try:
             ticker = await exchange.fetch_ticker(symbol)
             log.debug(f"Fetched ticker for {symbol} from {exchange_name}: {ticker['last']}")
-            return ticker['last']
+            self.price_cache[(exchange_name, symbol)] = (ticker['last'], time.time())
+            return {symbol: ticker['last']}
         except Exception as e:
             log.error(f"An unexpected error occurred fetching price for {symbol} on {exchange_name}: {e}")
-            return None
+            return {}
+
+    async def _fetch_prices(self, exchange_name: str, symbols: list) -> dict[str, float]:
+        """REST fallback for get_prices: one fetch_tickers call for all the symbols."""
+        tickers = await self.fetch_tickers(exchange_name, symbols)
+        fetched_at = time.time()
+        prices = {}
+        for symbol, ticker in tickers.items():
+            if ticker.get('last') is not None:
+                prices[symbol] = ticker['last']
+                self.price_cache[(exchange_name, symbol)] = (ticker['last'], fetched_at)
+        return prices
+
+    async def get_prices(self, exchange_name: str, symbols: list) -> dict[str, float]:
+        """
+        Like get_price for several symbols on one exchange. Symbols without a live stream
+        or a fresh cached price are fetched together through fetch_tickers, sharing any
+        request already in flight for them.
+        """
+        exchange_name = exchange_name.lower()
+        if exchange_name not in self.exchanges:
+            log.error(f"Exchange '{exchange_name}' not supported.")
+            return {}
+
+        prices, tasks, missing = {}, set(), []
+        now = time.time()
+        for symbol in symbols:
+            key = (exchange_name, symbol)
+            cached = self.ticker_cache.get(key)
+            if cached and now - cached[1] < self.ticker_stale_after_seconds:
+                prices[symbol] = cached[0]
+                continue
+            cached = self.price_cache.get(key)
+            if cached and now - cached[1] < self.price_cache_duration_seconds:
+                prices[symbol] = cached[0]
+            elif key in self.price_requests:
+                tasks.add(self.price_requests[key]) # Join a request another caller already started
+            else:
+                missing.append(symbol)
+
+        if missing:
+            task = asyncio.create_task(self._fetch_prices(exchange_name, missing))
+            self._track_price_request(exchange_name, missing, task)
+            tasks.add(task)
+        if tasks:
+            for fetched in await asyncio.gather(*(asyncio.shield(task) for task in tasks)):
+                prices.update(fetched)
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    async def fetch_tickers(self, exchange_name: str, symbols: list) -> dict:
+        """
+        Fetches tickers for several symbols on one exchange, in a single request where the
+        exchange supports it. Symbols the batch call didn't return are fetched concurrently.
+        """
+        exchange_name = exchange_name.lower()
+        if exchange_name not in self.exchanges:
+            log.error(f"Exchange '{exchange_name}' not supported.")
+            return {}
+        self._ensure_session()
+        exchange = self.exchanges[exchange_name]
+
+        tickers = {}
+        if exchange.has.get('fetchTickers'):
+            try:
+                tickers = await exchange.fetch_tickers(symbols)
+            except Exception as e:
+                # e.g. Bybit rejects a batch that mixes spot and derivative markets
+                log.warning(f"Batch ticker fetch failed on {exchange_name}, falling back to per-symbol requests: {e}")
+
+        missing = [symbol for symbol in symbols if symbol not in tickers]
+        if missing:
+            results = await asyncio.gather(*(exchange.fetch_ticker(s) for s in missing), return_exceptions=True)
+            for symbol, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    log.error(f"Error fetching ticker for {symbol} on {exchange_name}: {result}")
+                else:
+                    tickers[symbol] = result
+        return {symbol: tickers[symbol] for symbol in symbols if symbol in tickers}
 
     async def fetch_historical_data(self, exchange_name: str, symbol: str, timeframe: str = '1d', limit: int = 100) -> pd.DataFrame | None:
         """
@@ -36,6 +322,14 @@ class DataFetcher:
             log.error(f"Exchange '{exchange_name}' not supported for historical data.")
             return None
 
+        cache_key = (exchange_name, symbol, timeframe)
+        cached_data = self.ohlcv_cache.get(cache_key)
+        if cached_data and cached_data['limit'] >= limit and time.time() < cached_data['expires_at']:
+            log.debug(f"Using cached historical data for {symbol} on {exchange_name}")
+            # A new frame (reset_index copies), so callers adding columns can't touch the cache
+            return cached_data['df'].tail(limit).reset_index(drop=True)
+
+        self._ensure_session()
         exchange = self.exchanges[exchange_name]
         try:
             # fetch_ohlcv returns a list of lists: [timestamp, open, high, low, close, volume]
@@ -44,25 +338,62 @@ class DataFetcher:
                 log.warning(f"No historical data returned for {symbol} on {exchange_name}")
                 return None
             
-            # Convert to DataFrame for easier manipulation
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+            # Convert to DataFrame for easier manipulation, going through one contiguous
+            # array rather than letting pandas walk the nested lists value by value
+            arr = np.asarray(ohlcv, dtype=np.float64)
+            df = pd.DataFrame(arr[:, 1:].astype(OHLCV_DTYPE), columns=['open', 'high', 'low', 'close', 'volume'])
+            df.insert(0, 'timestamp', pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms'))
             log.info(f"Successfully fetched {len(df)} historical data points for {symbol} from {exchange_name}")
-            return df
+            now = time.time()
+            bar_seconds = exchange.parse_timeframe(timeframe)
+            next_bar_opens_at = (now // bar_seconds + 1) * bar_seconds
+            self.ohlcv_cache[cache_key] = {
+                'df': df, 'limit': limit,
+                'expires_at': min(now + self.ohlcv_cache_duration_seconds, next_bar_opens_at)
+            }
+            return df.copy()
         
         except Exception as e:
             log.error(f"Error fetching historical data for {symbol} on {exchange_name}: {e}")
             return None
         
+    async def fetch_historical_data_batch(self, exchange_name: str, symbols: list, timeframe: str = '1d', limit: int = 100) -> dict:
+        """
+        Fetches historical OHLCV data for several symbols concurrently.
+        Returns {symbol: DataFrame}, with None for symbols that could not be fetched.
+        """
+        semaphore = asyncio.Semaphore(8) # Stay well inside the exchange's rate limit
+
+        async def fetch_one(symbol):
+            async with semaphore:
+                return await self.fetch_historical_data(exchange_name, symbol, timeframe, limit)
+
+        results = await asyncio.gather(*(fetch_one(symbol) for symbol in symbols), return_exceptions=True)
+        frames = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                log.error(f"Error fetching historical data for {symbol} on {exchange_name}: {result}")
+                result = None
+            frames[symbol] = result
+        return frames
+
     async def fetch_option_instruments(self, currency: str = 'BTC') -> list:
         """Fetches all active option instruments for a given currency from Deribit."""
+        self._ensure_session()
         deribit = self.exchanges['deribit']
         try:
-            await deribit.load_markets()
+            if time.time() - self.markets_loaded_at > self.markets_cache_duration_seconds:
+                await deribit.load_markets(reload=True)
+                self.markets_loaded_at = time.time()
+                self.option_instruments_cache = {}
+            elif currency in self.option_instruments_cache:
+                return self.option_instruments_cache[currency]
+
             instruments = [
-                symbol for symbol in deribit.symbols 
-                if symbol.startswith(currency) and deribit.markets[symbol]['option']
+                symbol for symbol, market in deribit.markets.items()
+                if symbol.startswith(currency) and market['option']
             ]
+            self.option_instruments_cache[currency] = instruments
             log.info(f"Fetched {len(instruments)} option instruments for {currency}.")
             return instruments
         except Exception as e:
@@ -71,10 +402,23 @@ class DataFetcher:
     
     async def fetch_option_ticker(self, option_symbol: str) -> dict | None:
         """Fetches the full ticker for a specific option symbol from Deribit."""
+        cached_data = self.option_ticker_cache.get(option_symbol)
+        if cached_data and time.time() - cached_data['timestamp'] < self.option_ticker_cache_duration_seconds:
+            return cached_data['ticker']
+
+        self._ensure_session()
         deribit = self.exchanges['deribit']
         try:
             ticker = await deribit.fetch_ticker(option_symbol)
-            print(f"Fetched ticker for option {option_symbol}: {ticker}")
+            log.debug(f"Fetched ticker for option {option_symbol}: {ticker['last']}")
+            now = time.time()
+            if len(self.option_ticker_cache) >= self.option_ticker_cache_max_entries:
+                # Entries are only useful for a second, so just drop the expired ones
+                self.option_ticker_cache = {
+                    symbol: entry for symbol, entry in self.option_ticker_cache.items()
+                    if now - entry['timestamp'] < self.option_ticker_cache_duration_seconds
+                }
+            self.option_ticker_cache[option_symbol] = {'ticker': ticker, 'timestamp': now}
             return ticker
         except Exception as e:
             log.error(f"Error fetching ticker for option {option_symbol}: {e}")
@@ -87,6 +431,7 @@ class DataFetcher:
             log.error(f"Exchange '{exchange_name}' not supported for order book.")
             return None
         
+        self._ensure_session()
         exchange = self.exchanges[exchange_name]
         try:
             order_book = await exchange.fetch_order_book(symbol, limit=limit)
@@ -95,9 +440,48 @@ class DataFetcher:
             log.error(f"Error fetching order book for {symbol} on {exchange_name}: {e}")
             return None
 
+    async def fetch_order_books(self, exchange_name: str, symbols: list, limit: int = 25) -> dict:
+        """Fetches order books for several symbols on one exchange, batched where supported."""
+        exchange_name = exchange_name.lower()
+        if exchange_name not in self.exchanges:
+            log.error(f"Exchange '{exchange_name}' not supported for order book.")
+            return {}
+        self._ensure_session()
+        exchange = self.exchanges[exchange_name]
+
+        order_books = {}
+        if exchange.has.get('fetchOrderBooks'):
+            try:
+                order_books = await exchange.fetch_order_books(symbols, limit=limit)
+            except Exception as e:
+                log.warning(f"Batch order book fetch failed on {exchange_name}, falling back to per-symbol requests: {e}")
+
+        missing = [symbol for symbol in symbols if symbol not in order_books]
+        if missing:
+            results = await asyncio.gather(*(exchange.fetch_order_book(s, limit=limit) for s in missing), return_exceptions=True)
+            for symbol, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    log.error(f"Error fetching order book for {symbol} on {exchange_name}: {result}")
+                else:
+                    order_books[symbol] = result
+        return {symbol: order_books[symbol] for symbol in symbols if symbol in order_books}
+
     async def close_connections(self):
-        for name, exchange in self.exchanges.items():
-            await exchange.close()
+        """Stops ticker streams and closes every exchange; safe to call more than once."""
+        if self.closed:
+            return
+        self.closed = True
+        for task in self.ticker_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.ticker_tasks.values(), return_exceptions=True)
+        self.ticker_tasks.clear()
+        results = await asyncio.gather(*(exchange.close() for exchange in self.exchanges.values()), return_exceptions=True)
+        for name, result in zip(self.exchanges, results):
+            if isinstance(result, Exception):
+                log.warning(f"Error closing {name}: {result}")
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
 
 # Create a single instance
 data_fetcher_instance = DataFetcher()
\ No newline at end of file
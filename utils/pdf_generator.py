@@ -1,43 +1,162 @@
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Flowable
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from datetime import datetime
-import json
+from time import strftime, gmtime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import numpy as np
+import pandas as pd
 
-def create_report_pdf(filename: str, report_data: dict):
-    """Generates a formal PDF report."""
-    doc = SimpleDocTemplate(filename, rightMargin=inch/2, leftMargin=inch/2, topMargin=inch/2, bottomMargin=inch/2)
-    styles = getSampleStyleSheet()
+# The report header states UTC, so the timestamp is taken from gmtime() rather than local time
+GENERATED_ON_FORMAT = '%Y-%m-%d %H:%M:%S UTC'
+
+# Styles are identical for every report, so they are built once at import time
+_STYLES = getSampleStyleSheet()
+_H1 = _STYLES['h1']
+_H2 = _STYLES['h2']
+_NORMAL = _STYLES['Normal']
+
+_POSITION_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.grey),
+    ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
+    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+    ('BOTTOMPADDING', (0,0), (-1,0), 12),
+    ('BACKGROUND', (0,1), (-1,-1), colors.beige),
+    ('GRID', (0,0), (-1,-1), 1, colors.black)
+])
+
+_RISK_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0,0), (-1,0), colors.grey),
+    ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('GRID', (0,0), (-1,-1), 1, colors.black)
+])
+
+_HISTORY_HEADER = ['Timestamp', 'Action', 'Size', 'Venue', 'Cost (USD)']
+_HISTORY_COL_WIDTHS = [1.9*inch, 1.2*inch, 1.2*inch, 1.4*inch, 1.8*inch] # Fills the 7.5" text width
+
+class FixedGridTable(Flowable):
+    """
+    A plain grid table drawn straight onto the canvas with fixed column widths and row
+    height. Unlike platypus' Table it never measures cells, so laying out and splitting
+    across pages is linear in the number of rows. Used for the (potentially long) audit trail.
+    """
+    def __init__(self, header, rows, col_widths, row_height=0.25*inch, font_size=9):
+        super().__init__()
+        self.header = header
+        self.rows = rows
+        self.col_widths = col_widths
+        self.row_height = row_height
+        self.font_size = font_size
+
+    def wrap(self, availWidth, availHeight):
+        return sum(self.col_widths), (len(self.rows) + 1) * self.row_height
+
+    def split(self, availWidth, availHeight):
+        # The header is repeated on every page, so it takes one row of each part
+        fits = int(availHeight // self.row_height) - 1
+        if fits < 1:
+            return []
+        return [
+            FixedGridTable(self.header, self.rows[:fits], self.col_widths, self.row_height, self.font_size),
+            FixedGridTable(self.header, self.rows[fits:], self.col_widths, self.row_height, self.font_size),
+        ]
+
+    def draw(self):
+        c = self.canv
+        width, height = self.wrap(0, 0)
+        xs = [0]
+        for col_width in self.col_widths:
+            xs.append(xs[-1] + col_width)
+        ys = [height - i * self.row_height for i in range(len(self.rows) + 2)]
+        text_offset = (self.row_height - self.font_size) / 2 + 2
+
+        # Header row
+        c.setFillColor(colors.grey)
+        c.rect(0, ys[1], width, self.row_height, stroke=0, fill=1)
+        c.setFillColor(colors.whitesmoke)
+        c.setFont('Helvetica-Bold', self.font_size)
+        for x, cell in zip(xs, self.header):
+            c.drawString(x + 6, ys[1] + text_offset, cell)
+
+        # Body rows
+        c.setFillColor(colors.black)
+        c.setFont('Helvetica', self.font_size)
+        for y, row in zip(ys[2:], self.rows):
+            for x, cell in zip(xs, row):
+                c.drawString(x + 6, y + text_offset, str(cell))
+
+        c.setStrokeColor(colors.black)
+        c.setLineWidth(1)
+        c.grid(xs, ys)
+
+# Report layout is CPU-bound, so async callers run it here instead of on the event loop
+_PDF_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf")
+
+# Formatted audit-trail rows for recently reported hedge histories, most recent last.
+# Only this database-derived section is reused; the generation time, prices and risk
+# metrics change between calls, so the rest of the report is always rebuilt.
+_HISTORY_ROWS_CACHE = OrderedDict()
+_HISTORY_ROWS_CACHE_SIZE = 8
+
+def _history_rows(history) -> list:
+    """Formats hedge_history rows for the audit trail table, reusing the result for an unchanged history."""
+    key = tuple(tuple(row) for row in history)
+    history_rows = _HISTORY_ROWS_CACHE.get(key)
+    if history_rows is not None:
+        _HISTORY_ROWS_CACHE.move_to_end(key)
+        return history_rows
+
+    history_rows = []
+    if history:
+        # Format whole columns at once rather than cell by cell; venue and cost are native
+        # columns of hedge_history, so no per-row unpacking of 'details' is needed
+        hist_df = pd.DataFrame(history, columns=history[0].keys())
+        history_rows = np.column_stack([
+            hist_df['timestamp'],
+            hist_df['action'].str.upper(),
+            hist_df['size'].abs().map('{:.4f}'.format),
+            hist_df['venue'].fillna('N/A').str.upper(),
+            '$' + hist_df['total_cost_usd'].fillna(0).map('{:,.2f}'.format)
+        ]).tolist()
+
+    _HISTORY_ROWS_CACHE[key] = history_rows
+    if len(_HISTORY_ROWS_CACHE) > _HISTORY_ROWS_CACHE_SIZE:
+        _HISTORY_ROWS_CACHE.popitem(last=False)
+    return history_rows
+
+def create_report_pdf(filename: str, report_data: dict) -> bytes:
+    """
+    Generates a formal PDF report, writes it to filename and returns its bytes.
+    """
+    # Built in memory and written out in one go rather than as many small writes
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, rightMargin=inch/2, leftMargin=inch/2, topMargin=inch/2, bottomMargin=inch/2)
     story = []
 
     # Title
-    story.append(Paragraph("Portfolio Risk & Compliance Report", styles['h1']))
-    story.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}", styles['Normal']))
+    story.append(Paragraph("Portfolio Risk & Compliance Report", _H1))
+    story.append(Paragraph(f"Generated on: {strftime(GENERATED_ON_FORMAT, gmtime())}", _NORMAL))
     story.append(Spacer(1, 0.2*inch))
     
     # Position Snapshot
-    story.append(Paragraph("1. Position Snapshot", styles['h2']))
+    story.append(Paragraph("1. Position Snapshot", _H2))
     pos_data = [['Asset', 'Type', 'Quantity', 'Market Price', 'Value (USD)']]
     for pos in report_data['positions']:
         pos_data.append([
             pos['asset'], pos['type'], f"{pos['size']:.4f}", f"${pos['price']:,.2f}", f"${pos['value']:,.2f}"
         ])
     pos_table = Table(pos_data)
-    pos_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.grey),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('BOTTOMPADDING', (0,0), (-1,0), 12),
-        ('BACKGROUND', (0,1), (-1,-1), colors.beige),
-        ('GRID', (0,0), (-1,-1), 1, colors.black)
-    ]))
+    pos_table.setStyle(_POSITION_TABLE_STYLE)
     story.append(pos_table)
     story.append(Spacer(1, 0.2*inch))
 
     # Risk Metrics
-    story.append(Paragraph("2. Key Risk Metrics", styles['h2']))
+    story.append(Paragraph("2. Key Risk Metrics", _H2))
     risk = report_data['risk_metrics']
     risk_data = [
         ['Metric', 'Value'],
@@ -45,34 +164,23 @@ def create_report_pdf(filename: str, report_data: dict):
         ['1-Day 95% VaR', f"${risk['var']:,.2f}"]
     ]
     risk_table = Table(risk_data, colWidths=[3*inch, 2*inch])
-    risk_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.grey),
-        ('TEXTCOLOR',(0,0),(-1,0),colors.whitesmoke),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('GRID', (0,0), (-1,-1), 1, colors.black)
-    ]))
+    risk_table.setStyle(_RISK_TABLE_STYLE)
     story.append(risk_table)
     story.append(Spacer(1, 0.2*inch))
     
     # Audit Trail
-    story.append(Paragraph("3. Audit Trail (Recent Hedges)", styles['h2']))
-    history_data = [['Timestamp', 'Action', 'Size', 'Venue', 'Cost (USD)']]
-    for item in report_data['history']:
-        details = json.loads(item['details'])
-        history_data.append([
-            item['timestamp'],
-            item['action'].upper(),
-            f"{abs(item['size']):.4f}",
-            details.get('venue', 'N/A').upper(),
-            f"${details.get('total_cost_usd', 0):,.2f}"
-        ])
-    history_table = Table(history_data)
-    history_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.grey),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('GRID', (0,0), (-1,-1), 1, colors.black)
-    ]))
-    story.append(history_table)
+    story.append(Paragraph("3. Audit Trail (Recent Hedges)", _H2))
+    history_rows = _history_rows(report_data['history'])
+    story.append(FixedGridTable(_HISTORY_HEADER, history_rows, _HISTORY_COL_WIDTHS))
     
-    doc.build(story)
\ No newline at end of file
+    doc.build(story)
+
+    pdf_bytes = buffer.getvalue()
+    with open(filename, 'wb') as f:
+        f.write(pdf_bytes)
+    return pdf_bytes
+
+async def create_report_pdf_async(filename: str, report_data: dict) -> bytes:
+    """Runs create_report_pdf on the PDF worker thread so the bot keeps serving updates meanwhile."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PDF_EXECUTOR, create_report_pdf, filename, report_data)
\ No newline at end of file